@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Minimal Steam server query (A2S_INFO) client, used as a cheap UDP liveness and
+# player count check before opening an RCON connection.
+
+"""https://developer.valvesoftware.com/wiki/Server_queries#A2S_INFO"""
+
+import socket
+import struct
+import sys
+
+A2S_INFO = b'\xFF\xFF\xFF\xFFTSource Engine Query\x00'
+A2S_INFO_RESPONSE = 0x49
+S2C_CHALLENGE = 0x41
+SINGLE_PACKET = -1
+
+MAX_PACKET_LENGTH = 1400
+
+class A2SError(Exception):
+    pass
+
+def queryinfo(host, port, timeout=1.0):
+    """Send A2S_INFO to the query port and return the parsed reply as a dict with
+       name, map, folder, game, appid, players, maxplayers and bots. Raises A2SError
+       when the server does not answer in time or the reply can't be parsed.
+
+       Example usage:
+
+       import a2s
+       print(a2s.queryinfo('127.0.0.1', 27015)['players'])
+    """
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.settimeout(timeout)
+    try:
+        udp.connect((host, port))
+        udp.send(A2S_INFO)
+        data = udp.recv(MAX_PACKET_LENGTH)
+        if len(data) >= 9 and data[4] == S2C_CHALLENGE:
+            # newer servers want the request repeated with the challenge they sent
+            udp.send(A2S_INFO + data[5:9])
+            data = udp.recv(MAX_PACKET_LENGTH)
+    except socket.timeout:
+        raise A2SError('Timed out waiting for A2S_INFO reply from %s:%d' % (host, port,))
+    except socket.error as error:
+        raise A2SError('A2S_INFO query to %s:%d failed: %s' % (host, port, error,))
+    finally:
+        udp.close()
+    return parseinfo(data)
+
+def parseinfo(data):
+    """Parse an A2S_INFO reply packet. Should only be used internally."""
+    if len(data) < 6 or struct.unpack_from('<l', data)[0] != SINGLE_PACKET:
+        raise A2SError('Unexpected A2S reply header')
+    if data[4] != A2S_INFO_RESPONSE:
+        raise A2SError('Unexpected A2S reply type: 0x%02x' % (data[4],))
+
+    pos = 6 # header (4), type (1), protocol (1)
+    strings = []
+    for i in range(4):
+        end = data.find(b'\x00', pos)
+        if end < 0:
+            raise A2SError('A2S_INFO reply is truncated')
+        strings.append(data[pos:end].decode('utf-8', 'replace'))
+        pos = end + 1
+    if len(data) < pos + 5:
+        raise A2SError('A2S_INFO reply is truncated')
+    appid, players, maxplayers, bots = struct.unpack_from('<hBBB', data, pos)
+    return {'name': strings[0], 'map': strings[1], 'folder': strings[2], 'game': strings[3],
+            'appid': appid, 'players': players, 'maxplayers': maxplayers, 'bots': bots}
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: a2s.py host queryport')
+        sys.exit(1)
+    print(queryinfo(sys.argv[1], int(sys.argv[2])))
@@ -4,26 +4,121 @@
 # https://gist.github.com/Elektordi/0132b4609d57b227a217232d2c6af80e
 
 import datetime
+import json
 import re
-import requests
 import sqlite3
 import srcds
+import a2s
+import metrics
+import rcontrace
+import gamelog
 import os
 import sys
-import configparser
-import json
+import signal
+import marshal
+import argparse
+import time
+import threading
+import queue
+import random
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Default script variables
 notifyOfflineIntervalH = 1
 playerTable = 'ark_player_log'
 statusTable = 'ark_server_status'
+sessionTable = 'ark_player_session'
+hourlyRollupTable = 'ark_rollup_hourly'
+dailyRollupTable = 'ark_rollup_daily'
+playerDayRollupTable = 'ark_rollup_player_day'
+outboxTable = 'ark_outbox'
+outageTable = 'ark_outage'
+chatTable = 'ark_chat'
+chatSearchTable = 'ark_chat_fts'  # full text index of chatTable, when sqlite has FTS5
+indexTable = 'player_index'
+indexTotalsTable = 'player_server_totals'
+indexDbName = 'ark-index.db'  # shared by all servers, steamId -> current server and totals per server
+playerIndex = True          # keep the shared index and merge map hops into one notification
+transferWindowS = 120       # leave notifications wait this long for a join on another server (a transfer)
+historyRetentionDays = 180  # closed sessions older than this are pruned by --compact
+rollupRetentionDays = 730   # rollup rows older than this are pruned by --compact
+rollupMaxGapS = 3600        # a longer time between two polls (script not running) is left out of the hourly rollup
+chatRetentionDays = 365     # chat and game log lines older than this are pruned by --compact
+chatBatchRows = 500         # chat and game log lines inserted per statement, also the most held in memory
+chatMaxLineLength = 2000    # longer chat and game log lines are cut off
+chatAlertMaxPerCycle = 5    # keyword alerts sent per server and cycle, the rest are only counted
+chatSearchLimit = 50        # lines shown by --search-chat
 printTelegram = False       # set to False if running as cron job
 sendTelegram = True        # can set to False for development 
 printInfoToScreen = False   # set to False if running as cron job
+testRconFile = 'rconOutput.txt'  # listplayers reply used by the test helpers
+maxPollWorkers = 8          # number of servers polled at the same time
+daemonIntervalS = 60        # seconds between polls in daemon mode while players are online
+pollIntervalFastS = 15      # daemon mode: seconds between polls right after a player joined or left
+pollIntervalIdleS = 180     # daemon mode: seconds between polls while nobody is online
+pollBackoffMaxS = 1800      # daemon mode: longest wait between polls of an unreachable server
+pollJitter = 0.1            # spread polls by up to 10% so servers don't line up
+fullSyncIntervalS = 600     # with a queryport, do an rcon listplayers at least this often
+rconSentinel = True         # detect end of rcon replies with an empty sentinel command
+telegramApiUrl = 'https://api.telegram.org'
+telegramMaxMsgLength = 4096 # Telegram rejects longer messages, merged messages are split
+telegramMaxParallel = 4     # chats the outbox sends to at the same time
+outboxBackoffMaxS = 300     # longest wait before sending a message again after Telegram failed
+outboxMaxAgeH = 24          # messages that could not be sent for this long are dropped
+outboxCheckS = 30           # daemon mode: look for due messages at least this often
+schemaVersion = 5           # PRAGMA user_version of an up to date database, see migrateSchema
+configCacheFile = 'config.cache'  # parsed config.ini, rebuilt when config.ini changes
+configCacheVersion = 3      # increase when parseConfig changes, so older caches are rebuilt
+sqliteSynchronous = 'NORMAL'  # with WAL, NORMAL only syncs on checkpoints; use FULL to sync every commit
+metricsPromFile = None      # write a Prometheus textfile here after every cycle, or use --metrics-prom
+metricsJsonFile = None      # write a JSON metrics snapshot here after every cycle, or use --metrics-json
+statusPort = None           # daemon mode: serve the latest poll results as JSON on this port, or use --status-port
+statusHost = '127.0.0.1'    # address the status API listens on, keep it local and put a proxy in front if needed
+daemonWorkers = 1           # daemon mode: split the servers over this many processes, or use --workers
+workerRestartDelayS = 5     # wait at least this long before restarting a crashed worker process again
+recordDir = None            # append every listplayers reply to a trace file per server here, or use --record
+
+# counters and latency histograms, labeled with the server polled by the current thread
+registry = metrics.Metrics()
+currentServer = threading.local()
+# current time, the replay driver swaps in the time of the recorded reply
+clock = datetime.datetime.now
+# writes the rcon traces when recording is on
+recorder = None
+# connection to the shared player index, opened by getIndexDb
+indexCon = None
+# configured servers by id, to name the servers in the player index
+knownServers = {}
+# status API documents by path, (body, etag), replaced as a whole after every cycle
+statusDocs = {}
+# joins and leaves of the servers polled in the current cycle, for updatePlayerIndex
+cycleEvents = []
+cycleEventsLock = threading.Lock()
+# threads that send to the chats in parallel, created by drainOutbox
+outboxExecutor = None
+
+def timed(name, **labels):
+    return registry.timer(name, server=getattr(currentServer, 'name', ''), **labels)
+
+
+def countMetric(name, value=1, **labels):
+    registry.inc(name, value, server=getattr(currentServer, 'name', ''), **labels)
+
+
+def timedDb(op):
+    # decorator timing a function that runs sqlite statements
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            with timed('db_seconds', op=op):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
 
 def changeToWorkingDir():
     try:
-        dir = os.path.dirname(sys.argv[0])
+        dir = os.path.dirname(os.path.abspath(sys.argv[0]))
         os.chdir(dir)
     except IOError as error:
         print(f"Error changing to working directory using given file location {sys.argv[0]}:", error)
@@ -37,6 +132,48 @@ def createDbDir(dbDir):
 
 # Read config
 def readConfig():
+    # cron starts the script every minute, the parsed servers are kept in a cache file
+    # so configparser is only loaded when config.ini was changed
+    try:
+        stat = os.stat('config.ini')
+        cacheKey = [stat.st_mtime_ns, stat.st_size, configCacheVersion]
+    except OSError:
+        cacheKey = None
+    servers = readConfigCache(cacheKey)
+    if servers is None:
+        servers = parseConfig()
+        writeConfigCache(cacheKey, servers)
+    return servers
+
+
+def readConfigCache(cacheKey):
+    if cacheKey is None:
+        return None
+    try:
+        with open(configCacheFile, 'rb') as f:
+            cache = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(cache, dict) or cache.get('key') != cacheKey:
+        return None
+    return cache['servers']
+
+
+def writeConfigCache(cacheKey, servers):
+    if cacheKey is None:
+        return
+    tmpFile = f"{configCacheFile}.{os.getpid()}.tmp"
+    try:
+        # the cache holds the rcon passwords and bot tokens, readable by the owner only
+        with os.fdopen(os.open(tmpFile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            marshal.dump({'key': cacheKey, 'servers': servers}, f)
+        os.replace(tmpFile, configCacheFile)
+    except OSError as error:
+        print("Error writing config cache:", error)
+
+
+def parseConfig():
+    import configparser
     config = configparser.ConfigParser()
     config.read('config.ini')  
     servers = []
@@ -52,16 +189,23 @@ def readConfig():
         server['id'] = serverid
         server['dbname'] = "ark-%02d.db" % int(serverid)
         server['rconport'] = int(server['rconport'])
+        server['queryport'] = int(server['queryport']) if server.get('queryport') else None
+        server['ingestchat'] = config.getboolean(s, 'ingestchat', fallback=False)
+        server['chatalertkeywords'] = [keyword.strip().lower() for keyword in server.get('chatalertkeywords', '').split(',')
+                                       if keyword.strip()]
         servers.append(server)
-        #print(json.dumps(servers, indent=4))
     return servers
 
 def connectDB(dbName):
     try:
-        sqliteConnection = sqlite3.connect(dbName,detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        # check_same_thread is off because the daemon keeps connections open and hands them
+        # to a worker thread each cycle, a connection is never used by two threads at once
+        sqliteConnection = sqlite3.connect(dbName, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
         # print("Connected to SQLite")
         # https://stackoverflow.com/questions/576933/how-can-i-reference-columns-by-their-names-in-python-calling-sqlite/20042292
         sqliteConnection.row_factory = sqlite3.Row
+        # journal_mode=WAL is stored in the database file by createTable, synchronous is per connection
+        sqliteConnection.execute(f"PRAGMA synchronous={sqliteSynchronous};")
         return sqliteConnection
     except sqlite3.Error as error:
         print("Error connecting to database:", error)
@@ -69,55 +213,316 @@ def connectDB(dbName):
 
 
 def createTable(con,arkServerId):
-    sqlExists = f"SELECT COUNT(\"name\") FROM sqlite_master WHERE type='table' and name='{playerTable}'"
-    sqlCreatePlayerTable = f"""CREATE TABLE '{playerTable}' (
+    # the schema version is kept in PRAGMA user_version, so a run with an up to date
+    # database costs a single pragma instead of checking every table
+    cursor = con.cursor()
+    try:
+        version = cursor.execute("PRAGMA user_version;").fetchone()[0]
+        if version < schemaVersion:
+            migrateSchema(con, cursor, version, arkServerId)
+            cursor.execute(f"PRAGMA user_version = {schemaVersion};")
+            con.commit()
+            printInfo(f"Updated database schema of server {arkServerId} from version {version} to {schemaVersion}")
+    except sqlite3.Error as error:
+        print(f"Error creating or updating tables of server {arkServerId}:", error)
+    cursor.close()
+
+
+def migrateSchema(con, cursor, version, arkServerId):
+    # one block per schema version, a database is brought up to date from the version it has
+    if version < 1:
+        # databases of older releases have no version yet, everything is created if missing
+        # write ahead log: a commit appends to the log instead of rewriting pages in place
+        cursor.execute("PRAGMA journal_mode=WAL;")
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS '{playerTable}' (
                             steamId INTEGER PRIMARY KEY,
                             name TEXT,
                             last_logon TIMESTAMP,
                             last_logoff TIMESTAMP,
-                            online_now BOOLEAN);"""
-    sqlCreateStatusTable = f"""CREATE TABLE '{statusTable}' (
+                            online_now BOOLEAN);""")
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS '{statusTable}' (
                             serverId INTEGER PRIMARY KEY,
                             checked_on TIMESTAMP,
                             last_online TIMESTAMP,
                             last_offline TIMESTAMP,
                             last_notified TIMESTAMP,
-                            server_online BOOLEAN);"""
-    sqlInsert = f"INSERT INTO \"{statusTable}\" (\"serverId\") VALUES (?);"
-    cursor = con.cursor()
+                            server_online BOOLEAN,
+                            last_synced TIMESTAMP);""")
+        cursor.execute(f"INSERT OR IGNORE INTO \"{statusTable}\" (\"serverId\") VALUES (?);", (arkServerId,))
+        cursor.execute(f"PRAGMA table_info(\"{statusTable}\");")
+        if 'last_synced' not in [row['name'] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE \"{statusTable}\" ADD COLUMN last_synced TIMESTAMP;")
+        # partial index, only holds the players that are online right now
+        cursor.execute(f"""CREATE INDEX IF NOT EXISTS \"idx_{playerTable}_online_now\"
+                            ON \"{playerTable}\" (\"steamId\") WHERE online_now = 1;""")
+        # append-only play sessions, a session gets its end time when the player leaves
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS '{sessionTable}' (
+                            sessionId INTEGER PRIMARY KEY,
+                            steamId INTEGER NOT NULL,
+                            started TIMESTAMP NOT NULL,
+                            ended TIMESTAMP);""")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS \"idx_{sessionTable}_player\" ON \"{sessionTable}\" (\"steamId\", \"started\");")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS \"idx_{sessionTable}_ended\" ON \"{sessionTable}\" (\"ended\", \"started\");")
+        # rollups, maintained incrementally by updateRollups
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS '{hourlyRollupTable}' (
+                            hour TIMESTAMP PRIMARY KEY,
+                            samples INTEGER NOT NULL,
+                            player_samples INTEGER NOT NULL,
+                            peak_players INTEGER NOT NULL);""")
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS '{dailyRollupTable}' (
+                            day DATE PRIMARY KEY,
+                            unique_players INTEGER NOT NULL);""")
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS '{playerDayRollupTable}' (
+                            day DATE NOT NULL,
+                            steamId INTEGER NOT NULL,
+                            seconds REAL NOT NULL,
+                            PRIMARY KEY (day, steamId)) WITHOUT ROWID;""")
+    if version < 2:
+        # notifications, written in the same transaction as the change they are about
+        # and deleted once Telegram accepted them
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS '{outboxTable}' (
+                            id INTEGER PRIMARY KEY,
+                            created TIMESTAMP NOT NULL,
+                            next_attempt TIMESTAMP NOT NULL,
+                            attempts INTEGER NOT NULL DEFAULT 0,
+                            kind TEXT NOT NULL,
+                            payload TEXT NOT NULL);""")
+    if version < 3:
+        # chat and game log lines, see ingestChat
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS '{chatTable}' (
+                            id INTEGER PRIMARY KEY,
+                            time TIMESTAMP NOT NULL,
+                            kind TEXT NOT NULL,
+                            sender TEXT,
+                            message TEXT NOT NULL);""")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS \"idx_{chatTable}_time\" ON \"{chatTable}\" (\"time\");")
+        createChatSearch(cursor)
+    if version < 4:
+        # one row per period the server could not be reached, ended is set when it is back
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS '{outageTable}' (
+                            id INTEGER PRIMARY KEY,
+                            started TIMESTAMP NOT NULL,
+                            ended TIMESTAMP,
+                            duration_s REAL,
+                            players INTEGER NOT NULL);""")
+    if version < 5:
+        # time weighted hourly concurrency, daemon mode polls busy servers more often than idle ones
+        cursor.execute(f"PRAGMA table_info(\"{hourlyRollupTable}\");")
+        if 'player_seconds' not in [row['name'] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE \"{hourlyRollupTable}\" ADD COLUMN observed_seconds REAL NOT NULL DEFAULT 0;")
+            cursor.execute(f"ALTER TABLE \"{hourlyRollupTable}\" ADD COLUMN player_seconds REAL NOT NULL DEFAULT 0;")
+        cursor.execute(f"PRAGMA table_info(\"{statusTable}\");")
+        if 'last_sampled' not in [row['name'] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE \"{statusTable}\" ADD COLUMN last_sampled TIMESTAMP;")
+            cursor.execute(f"ALTER TABLE \"{statusTable}\" ADD COLUMN last_player_count INTEGER;")
+
+
+def createChatSearch(cursor):
+    # full text index, insertChatEntries adds each batch with one statement, which is several times
+    # faster than a trigger per row. Without FTS5 in sqlite, searchChat falls back to LIKE.
     try:
-        # check if table exists
-        cursor.execute(sqlExists)
-        if cursor.fetchone()[0] == 1:
-            # print(f"Table {dbTable} already exists, not recreating it")
-            pass
-        else:
-            cursor.execute(sqlCreatePlayerTable)
-            cursor.execute(sqlCreateStatusTable)
-            cursor.execute(sqlInsert, (arkServerId,))
-            con.commit()
-            printInfo(f"Created tables {playerTable} and {statusTable} for server {arkServerId}")
-    except sqlite3.Error as error:
-        print(f"Error creating {playerTable} and/or {statusTable} table:", error)
+        cursor.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS '{chatSearchTable}'
+                            USING fts5(sender, message, content='{chatTable}', content_rowid='id');""")
+    except sqlite3.OperationalError as error:
+        printInfo(f"Chat search without full text index: {error}")
+        return
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS \"{chatTable}_delete\" AFTER DELETE ON \"{chatTable}\" BEGIN
+                        INSERT INTO \"{chatSearchTable}\" (\"{chatSearchTable}\", rowid, sender, message)
+                        VALUES ('delete', old.id, old.sender, old.message);
+                        END;""")
+
+
+def newRconClient(server):
+    return srcds.SourceRcon(server['rconip'], server['rconport'], server['rconpass'], sentinel=rconSentinel,
+                            timer=lambda phase: registry.timer('rcon_seconds', server=server['name'], phase=phase))
+
+
+def probePlayerList(con, server, session):
+    # cheap A2S_INFO check over udp: when the player count matches the roster and a full sync
+    # isn't due yet, the players are assumed unchanged and rcon is skipped. Returns None when
+    # rcon is needed, also when the probe failed or the server is offline: only rcon decides
+    # whether the server is down or back up.
+    try:
+        with timed('a2s_seconds'):
+            info = a2s.queryinfo(server['rconip'], server['queryport'])
+    except a2s.A2SError as error:
+        countMetric('a2s_probes_total', result='failed')
+        printInfo(f"Server {server['name']}: A2S probe failed, falling back to rcon: {error}")
+        return None
+    if session['roster'] is None:
+        session['roster'] = loadOnlineRoster(con)
+    status = getSyncStatus(con, server)
+    if status is None or status['server_online'] != 1:
+        return None
+    lastSynced = status['last_synced']
+    if lastSynced is None or clock() - lastSynced > datetime.timedelta(seconds=fullSyncIntervalS):
+        return None
+    if info['players'] != len(session['roster']):
+        countMetric('a2s_probes_total', result='count_changed')
+        printInfo(f"Server {server['name']}: A2S reports {info['players']} players, "
+                  f"{len(session['roster'])} known, syncing via rcon")
+        return None
+    countMetric('a2s_probes_total', result='rcon_skipped')
+    updateServerStatus(con, server, 1)
+    session['online'] = True
+    return {steamId: player['name'] for steamId, player in session['roster'].items()}
+
+
+@timedDb('select_last_synced')
+def getSyncStatus(con, server):
+    cursor = con.cursor()
+    cursor.execute(f"SELECT \"last_synced\", \"server_online\" FROM \"{statusTable}\" WHERE serverId = ?;",
+                   (server['id'],))
+    row = cursor.fetchone()
     cursor.close()
+    return row
 
 
-def fetchRconPlayerList(con, server):
+def fetchRconPlayerList(con, server, rconServer=None, session=None, changes=None):
+    # returns None when the server could not be reached, the players that were online are
+    # then set offline by reconcileServerDown
     online = 1
     try:
-        rconServer = srcds.SourceRcon(server['rconip'], server['rconport'], server['rconpass'])
+        # a persistent session (daemon mode) reconnects and re-authenticates by itself
+        # when the connection was dropped
+        if rconServer is None:
+            rconServer = newRconClient(server)
         rconResult = rconServer.rcon('listplayers').decode("utf-8")
+        cursor = con.cursor()
+        cursor.execute(f"UPDATE \"{statusTable}\" SET \"last_synced\" = ? WHERE serverId = ?;",
+                       (clock(), server['id']))
+        cursor.close()
     except srcds.SourceRconError as error:
         online = 0
         print("Error retrieving playerlist via rcon: ", error)
-        notifyServerDown(con, server)
-        rconResult = "No Players Connected"
+        rconResult = None
+    if recorder is not None:
+        recorder.record(traceName(server), clock(), online == 1, rconResult)
+    if rconResult is None:
+        roster = reconcileServerDown(con, server, None if session is None else session['roster'], changes)
+        if session is not None:
+            session['roster'] = roster
     updateServerStatus(con, server, online)
+    if session is not None:
+        session['online'] = online == 1
     # writeRconResultToFile(rconResult)
-    return parseRconResult(rconResult, server)
+    return None if rconResult is None else parseRconResult(rconResult, server)
+
+
+@timedDb('server_down')
+def reconcileServerDown(con, server, roster=None, changes=None):
+    # a server that can't be reached has nobody online: all players and open sessions are closed
+    # with one statement per table, and the outage gets one row and one notification instead of
+    # a leave message per player. Returns the now empty roster.
+    if roster is None:
+        roster = loadOnlineRoster(con)
+    now = clock()
+    cursor = con.cursor()
+    cursor.execute(f"SELECT \"started\" FROM \"{outageTable}\" WHERE \"ended\" IS NULL ORDER BY \"started\" LIMIT 1;")
+    row = cursor.fetchone()
+    outageStart = None if row is None else row['started']
+    if row is None:
+        cursor.execute(f"INSERT INTO \"{outageTable}\" (\"started\", \"players\") VALUES (?, ?);", (now, len(roster)))
+    if len(roster) > 0:
+        # players online since before the session table existed have no open session, record it whole
+        cursor.execute(f"""INSERT INTO \"{sessionTable}\" (\"steamId\", \"started\", \"ended\")
+                        SELECT p.\"steamId\", p.\"last_logon\", ? FROM \"{playerTable}\" p
+                        WHERE p.online_now = 1 AND p.\"last_logon\" IS NOT NULL AND NOT EXISTS
+                        (SELECT 1 FROM \"{sessionTable}\" s WHERE s.\"steamId\" = p.\"steamId\" AND s.\"ended\" IS NULL);""",
+                       (now,))
+        cursor.execute(f"UPDATE \"{sessionTable}\" SET \"ended\" = ? WHERE \"ended\" IS NULL;", (now,))
+        cursor.execute(f"UPDATE \"{playerTable}\" SET \"online_now\" = 0, \"last_logoff\" = ? WHERE online_now = 1;",
+                       (now,))
+    cursor.close()
+    countMetric('transitions_total', len(roster), kind='leave')
+    events = [{'kind': 'leave', 'steamId': steamId, 'name': player['name'], 'time': now, 'lastTime': player['lastLogon']}
+              for steamId, player in roster.items()]
+    updateRollups(con, server, {}, [], [(event['steamId'], event['lastTime']) for event in events], now)
+    if changes is not None:
+        changes.extend(events)
+    notifyServerDown(con, server, [player['name'] for player in roster.values()], outageStart)
+    return {}
+
+
+def ingestChat(session):
+    # getchat and getgamelog return the lines since the previous call, both are sent in one
+    # pipelined round trip. The lines go from the socket through the parser into batched
+    # inserts, so the backlog after a server restart never has to fit in memory. Each batch
+    # is committed by itself: the write lock is not held while the next one is read from rcon.
+    server = session['server']
+    try:
+        packets = session['rcon'].rconstream(['getchat', 'getgamelog'])
+        entries = gamelog.parse(gamelog.iterlines(packets, chatMaxLineLength), [gamelog.parsechat, gamelog.parselog],
+                                clock())
+        lines = insertChatEntries(session, entries)
+    except srcds.SourceRconError as error:
+        # the lines inserted so far are kept, the server won't send them again
+        countMetric('chat_ingest_total', result='failed')
+        print(f"Error retrieving chat of server {server['name']} via rcon: ", error)
+        return
+    countMetric('chat_ingest_total', result='ok')
+    if lines > 0:
+        printInfo(f"Server {server['name']}: stored {lines} chat and game log line(s)")
+
+
+def insertChatEntries(session, entries):
+    sqlInsert = f"INSERT INTO \"{chatTable}\" (\"time\", \"kind\", \"sender\", \"message\") VALUES (?, ?, ?, ?);"
+    sqlIndex = f"""INSERT INTO \"{chatSearchTable}\" (rowid, sender, message)
+                  SELECT id, sender, message FROM \"{chatTable}\" WHERE id > ?;"""
+    con, server = session['con'], session['server']
+    search = hasChatSearch(con)
+    keywords = server['chatalertkeywords']
+    alerts = []
+    skippedAlerts = 0
+    lines = 0
+    cursor = con.cursor()
+    while True:
+        batch = list(itertools.islice(entries, chatBatchRows))
+        if len(batch) == 0:
+            break
+        with timed('db_seconds', op='insert_chat'):
+            lastId = cursor.execute(f"SELECT max(id) FROM \"{chatTable}\";").fetchone()[0] or 0
+            cursor.executemany(sqlInsert, [(entry['time'], entry['kind'], entry['sender'], entry['message'])
+                                           for entry in batch])
+            if search:
+                cursor.execute(sqlIndex, (lastId,))
+        commitSession(session)
+        lines += len(batch)
+        for entry in batch:
+            if entry['kind'] != 'chat' or not any(keyword in entry['message'].lower() for keyword in keywords):
+                continue
+            if len(alerts) < chatAlertMaxPerCycle:
+                alerts.append(entry)
+            else:
+                skippedAlerts += 1
+    cursor.close()
+    countMetric('chat_lines_total', lines)
+    if len(alerts) > 0:
+        countMetric('chat_alerts_total', len(alerts) + skippedAlerts)
+        queueTelegramMsg(con, formatChatAlertMsg(server, alerts, skippedAlerts))
+        commitSession(session)
+    return lines
+
+
+def formatChatAlertMsg(server, alerts, skippedAlerts):
+    msg = f"Server {server['name']}, chat alert:\n"
+    for entry in alerts:
+        msg += f"{entry['sender'] or 'unknown'}: {entry['message']}\n"
+    if skippedAlerts > 0:
+        msg += f"and {skippedAlerts} more line(s) with an alert keyword\n"
+    return msg
+
+
+def traceName(server):
+    return "ark-%02d.trace" % int(server['id'])
 
 
 def parseRconResult(rconResultStr, server):
+    with timed('parse_seconds'):
+        return parseRconLines(rconResultStr, server)
+
+
+def parseRconLines(rconResultStr, server):
     rconPlayerList = {}
     if 'No Players Connected' in rconResultStr:
         printInfo(f"Server {server['name']} reports no players online")
@@ -131,43 +536,100 @@ def parseRconResult(rconResultStr, server):
     return rconPlayerList
 
 
-def insertUpdatePlayersDB(con, server, rconPlayerList):
-    sqlSelect = f"""SELECT * FROM \"{playerTable}\";"""
+def insertUpdatePlayersDB(con, server, rconPlayerList, roster=None, changes=None):
+    # roster is the in-memory snapshot of the online players (steamId -> name, lastLogon). It is
+    # read from the db once when not given, then kept up to date with each join and leave, and
+    # returned so a long running poller can pass it back in the next cycle. changes, when given,
+    # receives the joins and leaves, for the player index.
+    # joins and leaves are the set differences with the rcon list, so the cost no longer grows
+    # with the number of players ever seen
+    if roster is None:
+        roster = loadOnlineRoster(con)
+    now = clock()
+    joined = [steamId for steamId in rconPlayerList if steamId not in roster]
+    left = [steamId for steamId in roster if steamId not in rconPlayerList]
+    countMetric('transitions_total', len(joined), kind='join')
+    countMetric('transitions_total', len(left), kind='leave')
+    events = []
+    closedSessions = []
+    # players that have gone offline
+    for steamId in left:
+        player = roster.pop(steamId)
+        updatePlayerRecord(con, {'steamid': steamId, 'name': player['name'], 'online_now': 0}, now)
+        closePlayerSession(con, steamId, player['lastLogon'], now)
+        closedSessions.append((steamId, player['lastLogon']))
+        events.append({'kind': 'leave', 'steamId': steamId, 'name': player['name'], 'time': now,
+                       'lastTime': player['lastLogon']})
+    # players that have come online, either known from an earlier session or new
+    knownPlayers = getPlayersFromDb(con, joined)
+    newPlayers = [{'steamid': steamId, 'name': rconPlayerList[steamId]}
+                  for steamId in joined if steamId not in knownPlayers]
+    insertPlayerRecords(con, newPlayers, now)
+    openPlayerSessions(con, joined, now)
+    markPlayersOnline(con, list(knownPlayers), now)
+    for steamId in joined:
+        if steamId in knownPlayers:
+            row = knownPlayers[steamId]
+            roster[steamId] = {'name': row['name'], 'lastLogon': now}
+            events.append({'kind': 'join', 'steamId': steamId, 'name': row['name'], 'time': now,
+                           'lastTime': row['last_logoff']})
+        else:
+            roster[steamId] = {'name': rconPlayerList[steamId], 'lastLogon': now}
+            events.append({'kind': 'join', 'steamId': steamId, 'name': rconPlayerList[steamId], 'time': now,
+                           'lastTime': None})
+    updateRollups(con, server, roster, joined, closedSessions, now)
+    notifyPlayerChanges(con, events, roster)
+    if changes is not None:
+        changes.extend(events)
+    return roster
+
+
+@timedDb('select_online')
+def loadOnlineRoster(con):
+    sqlSelectOnline = f"SELECT \"steamId\", \"name\", \"last_logon\" FROM \"{playerTable}\" WHERE online_now = 1;"
+    roster = {}
     cursor = con.cursor()
-    cursor.execute(sqlSelect)
-    # update players that are already in the db
-    for row in cursor:
-        # only update if online_now status has changed
-        if row[0] in rconPlayerList.keys() and row[4] == 0:
-            # player has come online
-            updatePlayerRecord(con, {'steamid': row[0], 'name': row[1], 'online_now': 1})
-            notifyPlayerOnline(row[1], 'online', row[3], server, con)
-            del rconPlayerList[row[0]]
-        elif row[0] not in rconPlayerList.keys() and row[4] == 1:
-            # player has gone offline
-            updatePlayerRecord(con, {'steamid': row[0], 'name': row[1], 'online_now': 0})
-            notifyPlayerOffline(row[1], 'offline', row[2], server, con)
-        elif row[0] in rconPlayerList.keys():
-            # player is still online, no update in db needed
-            del rconPlayerList[row[0]]
-    # insert any remaining players in the Rcon list as new records
-    for key, value in rconPlayerList.items():
-        insertPlayerRecord(con, {'steamid': key, 'name': value})
-        notifyPlayerOnline(value, 'online', None, server, con)
-
-
-def insertPlayerRecord(con, playerInfo):
-    printInfo('Adding to db player ' + playerInfo['name'] + ' with steamid ' + str(playerInfo['steamid']))
+    try:
+        cursor.execute(sqlSelectOnline)
+        for row in cursor:
+            roster[row['steamId']] = {'name': row['name'], 'lastLogon': row['last_logon']}
+    except sqlite3.Error as error:
+        print("Error reading playerlist in db:", error)
+        raise
+    cursor.close()
+    return roster
+
+
+@timedDb('select_players')
+def getPlayersFromDb(con, steamIds, chunkSize=500):
+    # look up just the given players by primary key, in chunks to stay below the sqlite variable limit
+    players = {}
+    cursor = con.cursor()
+    for i in range(0, len(steamIds), chunkSize):
+        chunk = steamIds[i:i + chunkSize]
+        sqlSelect = f"""SELECT \"steamId\", \"name\", \"last_logon\", \"last_logoff\" FROM \"{playerTable}\"
+                        WHERE \"steamId\" IN ({', '.join('?' * len(chunk))});"""
+        cursor.execute(sqlSelect, chunk)
+        for row in cursor:
+            players[row['steamId']] = row
+    cursor.close()
+    return players
+
+
+@timedDb('insert_players')
+def insertPlayerRecords(con, playerInfos, now):
+    for playerInfo in playerInfos:
+        printInfo('Adding to db player ' + playerInfo['name'] + ' with steamid ' + str(playerInfo['steamid']))
     sqlInsert = f"""INSERT INTO \"{playerTable}\" (\"steamId\", \"name\", \"last_logon\", \"online_now\") 
                 VALUES (?, ?, ?, ?);"""
     cursor = con.cursor()
-    data = (playerInfo['steamid'], playerInfo['name'], datetime.datetime.now(), 1)
-    cursor.execute(sqlInsert, data)
-    con.commit()
+    data = [(playerInfo['steamid'], playerInfo['name'], now, 1) for playerInfo in playerInfos]
+    cursor.executemany(sqlInsert, data)
     cursor.close()
 
 
-def updatePlayerRecord(con, playerInfo):
+@timedDb('update_player')
+def updatePlayerRecord(con, playerInfo, now):
     cursor = con.cursor()
     if playerInfo['online_now'] == 1:
         printInfo('Now ONline: updating player ' + playerInfo['name'] + ' with steamid ' + str(playerInfo['steamid']))
@@ -176,29 +638,382 @@ def updatePlayerRecord(con, playerInfo):
         printInfo('Now OFFline: updating player ' + playerInfo['name'] + ' with steamid ' + str(playerInfo['steamid']))
         sqlUpdate = f"UPDATE \"{playerTable}\" SET \"last_logoff\" = ?, \"online_now\" = ? WHERE \"steamId\" = ?;"
     try:
-        cursor.execute(sqlUpdate, (datetime.datetime.now(), playerInfo['online_now'], playerInfo['steamid']))
-        con.commit()
+        cursor.execute(sqlUpdate, (now, playerInfo['online_now'], playerInfo['steamid']))
     except sqlite3.Error as error:
         print("Error updating player info:", error)
     cursor.close()
   
 
-def getOnlinePlayersFromDb(con, server):
+@timedDb('update_players')
+def markPlayersOnline(con, steamIds, now, chunkSize=500):
+    # known players that came back, one statement per chunk instead of one per player, so a
+    # server coming back up with everybody rejoining costs the same as a single join
+    if len(steamIds) == 0:
+        return
+    printInfo(f"Now ONline: updating {len(steamIds)} known player(s)")
+    cursor = con.cursor()
+    for i in range(0, len(steamIds), chunkSize):
+        chunk = steamIds[i:i + chunkSize]
+        sqlUpdate = f"""UPDATE \"{playerTable}\" SET \"last_logon\" = ?, \"online_now\" = 1
+                        WHERE \"steamId\" IN ({', '.join('?' * len(chunk))});"""
+        cursor.execute(sqlUpdate, [now] + chunk)
+    cursor.close()
+
+
+@timedDb('open_sessions')
+def openPlayerSessions(con, steamIds, now):
+    sqlInsert = f"INSERT INTO \"{sessionTable}\" (\"steamId\", \"started\") VALUES (?, ?);"
+    cursor = con.cursor()
+    cursor.executemany(sqlInsert, [(steamId, now) for steamId in steamIds])
+    cursor.close()
+
+
+@timedDb('close_session')
+def closePlayerSession(con, steamId, lastLogon, now):
+    sqlUpdate = f"UPDATE \"{sessionTable}\" SET \"ended\" = ? WHERE \"steamId\" = ? AND \"ended\" IS NULL;"
+    sqlInsert = f"INSERT INTO \"{sessionTable}\" (\"steamId\", \"started\", \"ended\") VALUES (?, ?, ?);"
+    cursor = con.cursor()
+    cursor.execute(sqlUpdate, (now, steamId))
+    if cursor.rowcount == 0 and lastLogon is not None:
+        # player came online before the session table existed, record the whole session now
+        cursor.execute(sqlInsert, (steamId, lastLogon, now))
+    cursor.close()
+
+
+def getSessions(con, since, until, steamId=None):
+    # sessions overlapping [since, until), clipped to that window. Uses the (steamId, started)
+    # index for one player and the (ended, started) index for everybody.
+    if steamId is not None:
+        sqlSelect = f"""SELECT \"steamId\", \"started\", \"ended\" FROM \"{sessionTable}\"
+                        WHERE \"steamId\" = ? AND \"started\" < ? AND (\"ended\" > ? OR \"ended\" IS NULL);"""
+        params = (steamId, until, since)
+    else:
+        sqlSelect = f"""SELECT \"steamId\", \"started\", \"ended\" FROM \"{sessionTable}\"
+                        WHERE \"started\" < ? AND (\"ended\" > ? OR \"ended\" IS NULL);"""
+        params = (until, since)
+    now = clock()
+    cursor = con.cursor()
+    cursor.execute(sqlSelect, params)
+    sessions = []
+    for row in cursor:
+        start = max(row['started'], since)
+        end = min(row['ended'] if row['ended'] is not None else now, until)
+        if end > start:
+            sessions.append((row['steamId'], start, end))
+    cursor.close()
+    return sessions
+
+
+def splitByHour(start, end):
+    # yield (hour, seconds) for the part of [start, end) that falls in each hour
+    while start < end:
+        hour = start.replace(minute=0, second=0, microsecond=0)
+        partEnd = min(end, hour + datetime.timedelta(hours=1))
+        yield hour, (partEnd - start).total_seconds()
+        start = partEnd
+
+
+def splitByDay(start, end):
+    # yield (day, seconds) for the part of [start, end) that falls on each day
+    while start < end:
+        nextDay = datetime.datetime.combine(start.date() + datetime.timedelta(days=1), datetime.time())
+        partEnd = min(end, nextDay)
+        yield start.date(), (partEnd - start).total_seconds()
+        start = partEnd
+
+
+def getPlayerPlaytime(con, steamId, since, until):
+    # seconds played per day by one player between since and until
+    playtime = {}
+    for _, start, end in getSessions(con, since, until, steamId):
+        for day, seconds in splitByDay(start, end):
+            playtime[day] = playtime.get(day, 0) + seconds
+    return dict(sorted(playtime.items()))
+
+
+def getDayPlaytime(con, day):
+    # seconds played per player on one day, plus the peak number of concurrent players
+    since = datetime.datetime.combine(day, datetime.time())
+    until = since + datetime.timedelta(days=1)
+    sessions = getSessions(con, since, until)
+    playtime = {}
+    changes = []
+    for steamId, start, end in sessions:
+        playtime[steamId] = playtime.get(steamId, 0) + (end - start).total_seconds()
+        changes.append((start, 1))
+        changes.append((end, -1))
+    # leaves sort before joins at the same moment
+    concurrent = peak = 0
+    for _, change in sorted(changes):
+        concurrent += change
+        peak = max(peak, concurrent)
+    return playtime, peak
+
+
+@timedDb('rollups')
+def updateRollups(con, server, roster, joined, closedSessions, now):
+    # incremental: one hourly sample per cycle, playtime is added when a session closes.
+    # The player count of the previous poll is also added per second to the hours up to now, so
+    # player_seconds / observed_seconds is the average concurrency however unevenly polls are spaced.
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    sqlNewHour = f"INSERT OR IGNORE INTO \"{hourlyRollupTable}\" (hour, samples, player_samples, peak_players) VALUES (?, 0, 0, 0);"
+    sqlSample = f"""UPDATE \"{hourlyRollupTable}\" SET samples = samples + 1, player_samples = player_samples + ?,
+                    peak_players = MAX(peak_players, ?) WHERE hour = ?;"""
+    sqlWeighted = f"""UPDATE \"{hourlyRollupTable}\" SET observed_seconds = observed_seconds + ?,
+                    player_seconds = player_seconds + ? WHERE hour = ?;"""
+    cursor = con.cursor()
+    cursor.execute(sqlNewHour, (hour,))
+    if cursor.rowcount == 1:
+        # first cycle of the hour, count players whose session continues into a new day
+        addPlayerDays(con, [(now.date(), steamId, 0) for steamId in roster])
+    cursor.execute(sqlSample, (len(roster), len(roster), hour))
+    cursor.execute(f"SELECT \"last_sampled\", \"last_player_count\" FROM \"{statusTable}\" WHERE serverId = ?;",
+                   (server['id'],))
+    row = cursor.fetchone()
+    if row is not None and row['last_sampled'] is not None and \
+            datetime.timedelta(0) < now - row['last_sampled'] <= datetime.timedelta(seconds=rollupMaxGapS):
+        for partHour, seconds in splitByHour(row['last_sampled'], now):
+            cursor.execute(sqlNewHour, (partHour,))
+            cursor.execute(sqlWeighted, (seconds, seconds * row['last_player_count'], partHour))
+    cursor.execute(f"UPDATE \"{statusTable}\" SET \"last_sampled\" = ?, \"last_player_count\" = ? WHERE serverId = ?;",
+                   (now, len(roster), server['id']))
+    cursor.close()
+    playerDays = [(now.date(), steamId, 0) for steamId in joined]
+    for steamId, lastLogon in closedSessions:
+        if lastLogon is not None:
+            playerDays += [(day, steamId, seconds) for day, seconds in splitByDay(lastLogon, now)]
+    addPlayerDays(con, playerDays)
+
+
+def addPlayerDays(con, playerDays):
+    # add (day, steamId, seconds) to the player day rollup, counting new players in the daily rollup
+    sqlNew = f"INSERT OR IGNORE INTO \"{playerDayRollupTable}\" VALUES (?, ?, 0);"
+    sqlAdd = f"UPDATE \"{playerDayRollupTable}\" SET seconds = seconds + ? WHERE day = ? AND steamId = ?;"
+    sqlNewDay = f"INSERT OR IGNORE INTO \"{dailyRollupTable}\" VALUES (?, 0);"
+    sqlCount = f"UPDATE \"{dailyRollupTable}\" SET unique_players = unique_players + ? WHERE day = ?;"
+    # a few statements per day instead of per player, a full server going down or coming back
+    # costs the same as a single leave or join
+    days = {}
+    for day, steamId, seconds in playerDays:
+        days.setdefault(day, []).append((day, steamId))
+    cursor = con.cursor()
+    for day, rows in days.items():
+        cursor.executemany(sqlNew, rows)
+        newPlayers = cursor.rowcount
+        if newPlayers > 0:
+            cursor.execute(sqlNewDay, (day,))
+            cursor.execute(sqlCount, (newPlayers, day))
+    cursor.executemany(sqlAdd, [(seconds, day, steamId) for day, steamId, seconds in playerDays if seconds])
+    cursor.close()
+
+
+def compactHistory(con):
+    # retention job: prune raw sessions and rollups past their configured age, then reclaim space
+    now = clock()
+    sessionCutoff = now - datetime.timedelta(days=historyRetentionDays)
+    rollupCutoff = now - datetime.timedelta(days=rollupRetentionDays)
+    cursor = con.cursor()
+    cursor.execute(f"DELETE FROM \"{sessionTable}\" WHERE \"ended\" < ?;", (sessionCutoff,))
+    sessions = cursor.rowcount
+    cursor.execute(f"DELETE FROM \"{hourlyRollupTable}\" WHERE hour < ?;", (rollupCutoff,))
+    cursor.execute(f"DELETE FROM \"{dailyRollupTable}\" WHERE day < ?;", (rollupCutoff.date(),))
+    cursor.execute(f"DELETE FROM \"{playerDayRollupTable}\" WHERE day < ?;", (rollupCutoff.date(),))
+    cursor.execute(f"DELETE FROM \"{chatTable}\" WHERE time < ?;", (now - datetime.timedelta(days=chatRetentionDays),))
+    con.commit()
+    cursor.execute("VACUUM;")
+    cursor.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    cursor.close()
+    return sessions
+
+
+def hasChatSearch(con):
+    return con.execute("SELECT 1 FROM sqlite_master WHERE name = ?;", (chatSearchTable,)).fetchone() is not None
+
+
+def searchChat(con, query, limit):
+    # newest first. query is FTS5 syntax (words, "a phrase", OR, prefix*) when the index exists.
+    cursor = con.cursor()
+    if hasChatSearch(con):
+        cursor.execute(f"""SELECT c.* FROM \"{chatSearchTable}\" JOIN \"{chatTable}\" c ON c.id = \"{chatSearchTable}\".rowid
+                        WHERE \"{chatSearchTable}\" MATCH ? ORDER BY c.time DESC LIMIT ?;""", (query, limit))
+    else:
+        pattern = f"%{query}%"
+        cursor.execute(f"""SELECT * FROM \"{chatTable}\" WHERE message LIKE ? OR sender LIKE ?
+                        ORDER BY time DESC LIMIT ?;""", (pattern, pattern, limit))
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+def printChatSearch(dbDir, servers, query):
+    matches = []
+    for server in servers:
+        path = os.path.join(dbDir, server['dbname'])
+        if not os.path.exists(path):
+            continue
+        con = connectDB(path)
+        createTable(con, server['id'])
+        try:
+            matches += [(row['time'], server['name'], row) for row in searchChat(con, query, chatSearchLimit)]
+        except sqlite3.OperationalError as error:
+            print(f"Invalid search \"{query}\":", error)
+            return
+        finally:
+            con.close()
+    matches.sort(key=lambda match: match[0], reverse=True)
+    for logged, name, row in matches[:chatSearchLimit]:
+        print(f"{logged.strftime('%Y-%m-%d %H:%M')} {name} [{row['kind']}] {row['sender'] or ''}: {row['message']}")
+    if len(matches) == 0:
+        print(f"No chat or game log lines match \"{query}\"")
+
+
+def printPlayerPlaytime(con, steamId, since, until):
+    players = getPlayersFromDb(con, [steamId])
+    name = players[steamId]['name'] if steamId in players else 'unknown player'
+    playtime = getPlayerPlaytime(con, steamId, since, until)
+    print(f"Playtime of {name} ({steamId}) from {since.date()} until {until.date()}:")
+    for day, seconds in playtime.items():
+        print(f"{day}  {totalSecToHourMin(int(seconds))}")
+    print(f"Total  {totalSecToHourMin(int(sum(playtime.values())))}")
+
+
+def printDayPlaytime(con, day):
+    playtime, peak = getDayPlaytime(con, day)
+    players = getPlayersFromDb(con, list(playtime.keys()))
+    print(f"Playtime on {day}, {len(playtime)} player(s), peak of {peak} online at the same time:")
+    for steamId, seconds in sorted(playtime.items(), key=lambda item: -item[1]):
+        name = players[steamId]['name'] if steamId in players else steamId
+        print(f"{name} ({steamId})  {totalSecToHourMin(int(seconds))}")
+
+
+def getIndexDb(dbDir):
+    global indexCon
+    if indexCon is None:
+        indexCon = connectDB(os.path.join(dbDir, indexDbName))
+        createIndexTables(indexCon)
+    return indexCon
+
+
+def closeIndexDb():
+    global indexCon
+    if indexCon is not None:
+        indexCon.close()
+        indexCon = None
+
+
+def createIndexTables(con):
     cursor = con.cursor()
-    onlinePlayers = []
-    # print(f"Getting online players for server {server['id']}")
-    # get online players from db
-    sqlSelect = f"SELECT * from \"{playerTable}\" WHERE online_now = 1;"
     try:
-        cursor.execute(sqlSelect)
+        version = cursor.execute("PRAGMA user_version;").fetchone()[0]
+        if version < 1:
+            cursor.execute("PRAGMA journal_mode=WAL;")
+            cursor.execute(f"""CREATE TABLE IF NOT EXISTS '{indexTable}' (
+                            steamId INTEGER PRIMARY KEY,
+                            name TEXT,
+                            server_id INTEGER NOT NULL,
+                            online_now BOOLEAN NOT NULL,
+                            online_since TIMESTAMP,
+                            left_at TIMESTAMP,
+                            last_seen TIMESTAMP);""")
+            cursor.execute(f"""CREATE INDEX IF NOT EXISTS \"idx_{indexTable}_online\"
+                            ON \"{indexTable}\" (\"server_id\") WHERE online_now = 1;""")
+            cursor.execute(f"""CREATE TABLE IF NOT EXISTS '{indexTotalsTable}' (
+                            steamId INTEGER NOT NULL,
+                            server_id INTEGER NOT NULL,
+                            seconds REAL NOT NULL DEFAULT 0,
+                            sessions INTEGER NOT NULL DEFAULT 0,
+                            first_seen TIMESTAMP,
+                            last_seen TIMESTAMP,
+                            PRIMARY KEY (steamId, server_id)) WITHOUT ROWID;""")
+            cursor.execute("PRAGMA user_version = 1;")
+            con.commit()
     except sqlite3.Error as error:
-        print("Error reading playerlist in db:", error)
-    for row in cursor:
-        # print(f"player {row[1]}")
-        onlinePlayers.append({'name': row[1], 'lastLogon': row[2]})
-    return onlinePlayers
+        print("Error creating player index tables:", error)
+    cursor.close()
+
+
+def updatePlayerIndex(dbDir):
+    # end of a cycle: apply the joins and leaves of all polled servers to the shared index,
+    # in one transaction
+    if not playerIndex:
+        return
+    with cycleEventsLock:
+        batches = cycleEvents[:]
+        del cycleEvents[:]
+    if len(batches) == 0:
+        return
+    con = getIndexDb(dbDir)
+    try:
+        with timed('db_seconds', op='player_index'):
+            # take the write lock right away, worker processes share the index
+            con.execute("BEGIN IMMEDIATE;")
+            cursor = con.cursor()
+            indexPlayerLeaves(cursor, [(int(server['id']), event) for server, events in batches
+                                       for event in events if event['kind'] == 'leave'])
+            indexPlayerJoins(cursor, [(int(server['id']), event) for server, events in batches
+                                      for event in events if event['kind'] == 'join'])
+            cursor.close()
+            con.commit()
+    except sqlite3.Error as error:
+        con.rollback()
+        print("Error updating player index:", error)
+
+
+def indexPlayerLeaves(cursor, leaves):
+    # leaves is a list of (serverId, event), each statement runs once for all of them
+    addPlayerServerTime(cursor, [(event['steamId'], serverId, event['lastTime'], event['time'])
+                                 for serverId, event in leaves])
+    # the player may already have been seen joining another server
+    cursor.executemany(f"""UPDATE \"{indexTable}\" SET \"online_now\" = 0, \"left_at\" = ?, \"last_seen\" = ?
+                        WHERE \"steamId\" = ? AND \"server_id\" = ?;""",
+                       [(event['time'], event['time'], event['steamId'], serverId) for serverId, event in leaves])
+
+
+def indexPlayerJoins(cursor, joins):
+    cursor.executemany(f"""INSERT OR REPLACE INTO \"{indexTable}\" (\"steamId\", \"name\", \"server_id\", \"online_now\",
+                        \"online_since\", \"left_at\", \"last_seen\") VALUES (?, ?, ?, 1, ?, NULL, ?);""",
+                       [(event['steamId'], event['name'], serverId, event['time'], event['time']) for serverId, event in joins])
+    cursor.executemany(f"INSERT OR IGNORE INTO \"{indexTotalsTable}\" (\"steamId\", \"server_id\", \"first_seen\") VALUES (?, ?, ?);",
+                       [(event['steamId'], serverId, event['time']) for serverId, event in joins])
+
+
+def addPlayerServerTime(cursor, sessions):
+    # sessions is a list of (steamId, serverId, lastLogon, lastLogoff)
+    sqlNew = f"INSERT OR IGNORE INTO \"{indexTotalsTable}\" (\"steamId\", \"server_id\", \"first_seen\") VALUES (?, ?, ?);"
+    sqlAdd = f"""UPDATE \"{indexTotalsTable}\" SET \"seconds\" = \"seconds\" + ?, \"sessions\" = \"sessions\" + 1,
+                \"last_seen\" = ? WHERE \"steamId\" = ? AND \"server_id\" = ?;"""
+    cursor.executemany(sqlNew, [(steamId, serverId, lastLogon or lastLogoff) for steamId, serverId, lastLogon, lastLogoff in sessions])
+    cursor.executemany(sqlAdd, [((lastLogoff - lastLogon).total_seconds() if lastLogon is not None else 0,
+                                 lastLogoff, steamId, serverId) for steamId, serverId, lastLogon, lastLogoff in sessions])
+
+
+def serverName(serverId):
+    return knownServers[serverId]['name'] if serverId in knownServers else f"server {serverId}"
+
+
+def printWhereIs(con, steamId):
+    # primary key lookups only, no server database is opened
+    cursor = con.cursor()
+    cursor.execute(f"SELECT * FROM \"{indexTable}\" WHERE \"steamId\" = ?;", (steamId,))
+    row = cursor.fetchone()
+    if row is None:
+        print(f"Player {steamId} is not in the player index")
+        cursor.close()
+        return
+    if row['online_now'] == 1:
+        print(f"{row['name']} ({steamId}) is online on {serverName(row['server_id'])} "
+              f"since {row['online_since'].strftime('%Y-%m-%d %H:%M')}")
+    else:
+        print(f"{row['name']} ({steamId}) is offline, last seen on {serverName(row['server_id'])} "
+              f"at {row['last_seen'].strftime('%Y-%m-%d %H:%M')}")
+    cursor.execute(f"""SELECT * FROM \"{indexTotalsTable}\" WHERE \"steamId\" = ? ORDER BY \"seconds\" DESC;""",
+                   (steamId,))
+    for total in cursor:
+        print(f"{serverName(total['server_id'])}  {totalSecToHourMin(int(total['seconds']))} in "
+              f"{total['sessions']} session(s), first seen {total['first_seen'].strftime('%Y-%m-%d')}")
+    cursor.close()
+
 
-    
 def formatOnlinePlayersMsg(onlinePlayers):
     if len(onlinePlayers) == 0:
         return "No other players online."
@@ -207,14 +1022,14 @@ def formatOnlinePlayersMsg(onlinePlayers):
     else:
         str = f"There are {len(onlinePlayers)} players online:\n"
     for player in onlinePlayers:
-        totalSec = int((datetime.datetime.now() - player['lastLogon']).total_seconds())
+        totalSec = int((clock() - player['lastLogon']).total_seconds())
         str += f"{player['name']} since {player['lastLogon'].strftime('%H:%M')} ({totalSecToHourMin(totalSec)})\n"
     return str
 
 
 def writeRconResultToFile(rconResult):
     f = open(testRconFile, 'w')
-    f.write(rconResult.decode("utf-8"))
+    f.write(rconResult)
     f.close()
 
 
@@ -223,14 +1038,15 @@ def testPrintDictionary(dict):
         print(str(key) + ': ' + str(value))
 
 
-def testFetchRConPlayerListFile():
+def testFetchRConPlayerListFile(server):
     try:
         file = open(testRconFile, 'r')
     except IOError as error:
         print(f"Error reading rcon test file  {testRconFile}:", error)
         exit()
     rconResultStr = file.read()
-    return parseRconResult(rconResultStr)
+    file.close()
+    return parseRconResult(rconResultStr, server)
 
 
 def testAddPlayersDB(con):
@@ -245,7 +1061,7 @@ def testAddPlayersDB(con):
                 VALUES (?, ?, ?, ?, ?);"""
     cursor = con.cursor()
     for key, value in playerList.items():
-        data = (key, value, datetime.datetime.now(), datetime.datetime.now(), 1)
+        data = (key, value, clock(), clock(), 1)
         cursor.execute(sqlInsert, data)
     con.commit()
     cursor.close()
@@ -281,7 +1097,9 @@ def testListStatusDB(con):
     print('=====')
 
 
-def notifyServerDown(con, server):
+@timedDb('server_down')
+def notifyServerDown(con, server, playerNames, outageStart=None):
+    # outageStart is None when the server just went down, playerNames are the players that were online
     cursor = con.cursor()
     # check if we should notify based on interval defined
     sqlSelect = f"SELECT \"last_notified\", \"server_online\" from \"{statusTable}\" WHERE serverId = ?;"
@@ -292,20 +1110,47 @@ def notifyServerDown(con, server):
         print("Error reading last notified timestamp in db:", error)
     if row['last_notified'] is not None:
         stayQuietUntil = row['last_notified'] + datetime.timedelta(hours=notifyOfflineIntervalH)
-        if datetime.datetime.now() < stayQuietUntil and row['server_online'] == 0:
+        if clock() < stayQuietUntil and row['server_online'] == 0:
             printInfo("Not sending offline notification, interval not yet exceeded")
             return
     print("Sending offline notification")
     sqlUpdate = f"UPDATE \"{statusTable}\" SET \"last_notified\" = ? WHERE serverId = ?;"
     try:
-        cursor.execute(sqlUpdate, (datetime.datetime.now(),server['id']))
-        con.commit()
+        cursor.execute(sqlUpdate, (clock(),server['id']))
     except sqlite3.Error as error:
         print("Error updating last notified timestamp in db:", error)
     cursor.close()
-    sendTelegramMsg(server, "Server \"" + server['name'] + "\" seems to be offline, rcon connect failed.")
+    if outageStart is not None:
+        queueTelegramMsg(con, f"Server \"{server['name']}\" is still offline, since "
+                              f"{outageStart.strftime('%H:%M')} ({formatDuration(outageStart, clock())}).")
+        return
+    msg = f"Server \"{server['name']}\" seems to be offline, rcon connect failed."
+    if len(playerNames) > 0:
+        msg += f" {len(playerNames)} player(s) were online: {', '.join(playerNames)}."
+    queueTelegramMsg(con, msg)
+
+
+@timedDb('server_up')
+def closeOutage(con):
+    # returns when the outage started, None when there was none (a new database)
+    cursor = con.cursor()
+    cursor.execute(f"SELECT \"id\", \"started\" FROM \"{outageTable}\" WHERE \"ended\" IS NULL ORDER BY \"started\" LIMIT 1;")
+    row = cursor.fetchone()
+    if row is None:
+        cursor.close()
+        return None
+    now = clock()
+    cursor.execute(f"UPDATE \"{outageTable}\" SET \"ended\" = ?, \"duration_s\" = ? WHERE \"ended\" IS NULL;",
+                   (now, (now - row['started']).total_seconds()))
+    cursor.close()
+    return row['started']
 
 
+def formatDuration(start, end):
+    return totalSecToHourMin(int((end - start).total_seconds()))
+
+
+@timedDb('server_status')
 def updateServerStatus(con, server, is_online):
     cursor = con.cursor()
     # check if we should notify based on interval defined
@@ -318,56 +1163,388 @@ def updateServerStatus(con, server, is_online):
     was_online = 0 if row['server_online'] is None else row['server_online']
     if is_online == 1 and was_online == 0:
         printInfo(f"Server {server['name']} is (back) online")
-        sendTelegramMsg(server, "Server \"" + server['name'] + "\" is online.")
+        outageStart = closeOutage(con)
+        if outageStart is None:
+            queueTelegramMsg(con, "Server \"" + server['name'] + "\" is online.")
+        else:
+            queueTelegramMsg(con, f"Server \"{server['name']}\" is back online after being offline for "
+                                  f"{formatDuration(outageStart, clock())}.")
         sqlUpdate = f"""UPDATE \"{statusTable}\" SET \"checked_on\" = ?,
                             \"last_online\" = ?, \"server_online\" = ?, 
                             \"last_notified\" = ? WHERE \"serverId\" = ?"""
-        cursor.execute(sqlUpdate, (datetime.datetime.now(), datetime.datetime.now(), is_online,
-                               datetime.datetime.now(), server['id']))
+        cursor.execute(sqlUpdate, (clock(), clock(), is_online,
+                               clock(), server['id']))
     else:
         sqlUpdate = f"""UPDATE \"{statusTable}\" SET \"checked_on\" = ?,
                             \"last_offline\" = ?, \"server_online\" = ? WHERE \"serverId\" = ?"""
-        cursor.execute(sqlUpdate, (datetime.datetime.now(), datetime.datetime.now(), is_online,
+        cursor.execute(sqlUpdate, (clock(), clock(), is_online,
                                server['id']))
-    con.commit()
     cursor.close()
 
 
-def notifyPlayerOnline(name, status, lastLogOff, server, con):
-    msg = f"Server {server['name']}\nArk player {name} is now {status}."
+def formatPlayerOnlineMsg(name, lastLogOff):
+    msg = f"Ark player {name} is now online."
     if lastLogOff is not None:
         offlineTime = lastLogOff.strftime("%H:%M")
-        if datetime.datetime.now().strftime("%Y%m%d") == lastLogOff.strftime("%Y%m%d"):
+        if clock().strftime("%Y%m%d") == lastLogOff.strftime("%Y%m%d"):
             msg += f" Player went last offline today at {offlineTime}"
-        elif (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y%m%d") == lastLogOff.strftime("%Y%m%d"):
+        elif (clock() - datetime.timedelta(days=1)).strftime("%Y%m%d") == lastLogOff.strftime("%Y%m%d"):
             msg += f" Player went last offline yesterday at {offlineTime}"
         else:
-            offlineDaysAgo = (datetime.datetime.now() - lastLogOff).days
+            offlineDaysAgo = (clock() - lastLogOff).days
             offlineDate = lastLogOff.strftime("%A %d %b %Y %H:%M")
             msg += f" Player went last offline on {offlineDate}, {offlineDaysAgo} days ago"
-    msg += "\n" + formatOnlinePlayersMsg(getOnlinePlayersFromDb(con, server))
-    sendTelegramMsg(server, msg)
+    return msg
 
 
-def notifyPlayerOffline(name, status, lastLogon, server, con):
-    msg = f"Server {server['name']}\nArk player {name} is now {status}."
+def formatPlayerOfflineMsg(name, lastLogon, lastLogoff=None):
+    msg = f"Ark player {name} is now offline."
     if lastLogon is not None:
-        timeOnline = ':'.join(str(datetime.datetime.now() - lastLogon).split(':')[:2])
+        timeOnline = ':'.join(str((lastLogoff or clock()) - lastLogon).split(':')[:2])
         msg += f" Player was online for {timeOnline}."
-    msg += "\n" + formatOnlinePlayersMsg(getOnlinePlayersFromDb(con, server))
-    sendTelegramMsg(server, msg)
+    return msg
+
+
+def formatPlayerMovedMsg(name, fromServerName, toServerName):
+    return f"Ark player {name} moved from {fromServerName} to {toServerName}."
+
+
+def formatPlayerChangesMsg(server, events, onlinePlayers):
+    # one message per server and cycle, the roster is rendered once after all changes
+    eventMsgs = []
+    for event in events:
+        if event['kind'] == 'join':
+            eventMsgs.append(formatPlayerOnlineMsg(event['name'], event['lastTime']))
+        elif event['kind'] == 'leave':
+            eventMsgs.append(formatPlayerOfflineMsg(event['name'], event['lastTime'], event['time']))
+        else:
+            eventMsgs.append(formatPlayerMovedMsg(event['name'], event['fromServer'], event['toServer']))
+    return f"Server {server['name']}\n" + "\n".join(eventMsgs) + "\n" + formatOnlinePlayersMsg(onlinePlayers)
+
+
+def notifyPlayerChanges(con, events, roster):
+    # joins go out with the roster of this cycle. Each leave waits transferWindowS in the outbox,
+    # so drainOutbox can merge it with a join on another server into one transfer.
+    if len(events) == 0:
+        return
+    now = clock()
+    held = [event for event in events if event['kind'] == 'leave' and transferWindowS > 0]
+    if len(held) < len(events):
+        queueOutbox(con, 'players', {'events': [event for event in events if event not in held],
+                                     'roster': [dict(player) for player in roster.values()]}, now)
+    for event in held:
+        queueOutbox(con, 'leave', {'event': event}, now + datetime.timedelta(seconds=transferWindowS))
+
+
+def queueTelegramMsg(con, sendText):
+    queueOutbox(con, 'text', {'text': sendText}, clock())
+
+
+@timedDb('outbox_insert')
+def queueOutbox(con, kind, payload, nextAttempt):
+    # part of the poll transaction, the message is stored only when the change it is about is
+    # committed. A crash before the commit drops both, never only one of them.
+    sqlInsert = f"INSERT INTO \"{outboxTable}\" (\"created\", \"next_attempt\", \"kind\", \"payload\") VALUES (?, ?, ?, ?);"
+    cursor = con.cursor()
+    cursor.execute(sqlInsert, (clock(), nextAttempt, kind, json.dumps(payload, default=lambda value: value.isoformat())))
+    cursor.close()
+
+
+def loadOutbox(con, server):
+    cursor = con.cursor()
+    cursor.execute(f"SELECT * FROM \"{outboxTable}\" ORDER BY \"id\";")
+    rows = []
+    for row in cursor:
+        payload = json.loads(row['payload'])
+        for event in payload.get('events', []) + ([payload['event']] if 'event' in payload else []):
+            event['time'] = parseTime(event['time'])
+            event['lastTime'] = parseTime(event.get('lastTime'))
+        for player in payload.get('roster', []):
+            player['lastLogon'] = parseTime(player['lastLogon'])
+        rows.append({'id': row['id'], 'server': server, 'con': con, 'created': row['created'],
+                     'nextAttempt': row['next_attempt'], 'attempts': row['attempts'], 'kind': row['kind'],
+                     'payload': payload, 'absorbed': [], 'done': False})
+    cursor.close()
+    return rows
+
+
+def parseTime(value):
+    return None if value is None else datetime.datetime.fromisoformat(value)
+
+
+def drainOutbox(cons):
+    # send what is due in the outboxes of the given servers, cons is a list of (server, con). Only the
+    # sender may use the connections meanwhile. Returns the number of Telegram messages sent and when
+    # the next message is due, None when the outboxes are empty.
+    now = clock()
+    rows = []
+    with timed('db_seconds', op='outbox_load'):
+        for server, con in cons:
+            rows += loadOutbox(con, server)
+    if len(rows) == 0:
+        return 0, None
+    mergeTransfers(rows, now)
+    finished = []
+    tooOld = now - datetime.timedelta(hours=outboxMaxAgeH)
+    for row in rows:
+        if not row['done'] and row['created'] < tooOld:
+            print(f"Dropping notification for server {row['server']['name']} from {row['created']}, it could not be sent")
+            registry.inc('outbox_dropped_total', chat=row['server']['telegrambotchatid'])
+            row['done'] = True
+            finished.append(row)
+    chats = {}
+    for server, text, itemRows in renderOutbox([row for row in rows if not row['done'] and row['nextAttempt'] <= now],
+                                               cons, finished):
+        chats.setdefault((server['telegrambottoken'], server['telegrambotchatid']), []).append((text, itemRows))
+    results = []
+    if len(chats) == 1:
+        for (token, chatId), items in chats.items():
+            results += sendOutboxChat(token, chatId, items)
+    elif len(chats) > 1:
+        for future in [getOutboxExecutor().submit(sendOutboxChat, token, chatId, items)
+                       for (token, chatId), items in chats.items()]:
+            results += future.result()
+    results.append((finished, 'finished', None))
+    sent = len([result for result in results if result[1] == 'sent'])
+    with timed('db_seconds', op='outbox_update'):
+        finishOutboxRows(cons, results, now)
+    pending = [row['nextAttempt'] for row in rows if not row['done']]
+    return sent, min(pending) if len(pending) > 0 else None
+
+
+def mergeTransfers(rows, now):
+    # a join while a leave of the same player is still held back in an outbox: on another server
+    # the two become one transfer, on the same server (a reconnect) both are dropped
+    leaves = {}
+    for row in rows:
+        if row['kind'] == 'leave':
+            leaves.setdefault(row['payload']['event']['steamId'], []).append(row)
+    if len(leaves) == 0:
+        return
+    for row in rows:
+        if row['kind'] != 'players' or row['nextAttempt'] > now:
+            continue
+        events = []
+        for event in row['payload']['events']:
+            leave = None
+            if event['kind'] == 'join':
+                leave = next((candidate for candidate in leaves.get(event['steamId'], [])
+                              if not candidate['done'] and candidate['payload']['event']['time'] <= event['time']), None)
+            if leave is None:
+                events.append(event)
+                continue
+            # the leave is deleted together with this row, once it is sent
+            leave['done'] = True
+            row['absorbed'].append(leave)
+            if leave['server']['id'] == row['server']['id']:
+                registry.inc('transfers_total', kind='reconnect')
+                continue
+            registry.inc('transfers_total', kind='transfer')
+            events.append({'kind': 'transfer', 'steamId': event['steamId'], 'name': event['name'], 'time': event['time'],
+                           'fromServer': leave['server']['name'], 'toServer': row['server']['name']})
+        row['payload']['events'] = events
+
+
+def renderOutbox(rows, cons, finished):
+    # yields (server, text, rows) in the order the messages were queued. The due leaves of a
+    # server go into one message with the roster of now.
+    items = []
+    leaves = {}
+    for row in rows:
+        if row['kind'] == 'text':
+            items.append((row['created'], row['server'], row['payload']['text'], [row]))
+        elif row['kind'] == 'players':
+            if len(row['payload']['events']) == 0:
+                row['done'] = True
+                finished += [row] + row['absorbed']
+                continue
+            text = formatPlayerChangesMsg(row['server'], row['payload']['events'], row['payload']['roster'])
+            items.append((row['created'], row['server'], text, [row] + row['absorbed']))
+        elif isOnlineElsewhere(row, cons):
+            # the join on the other server was notified before this server noticed the leave
+            registry.inc('transfers_total', kind='late')
+            row['done'] = True
+            finished.append(row)
+        else:
+            leaves.setdefault(row['server']['id'], []).append(row)
+    for leaveRows in leaves.values():
+        server, con = leaveRows[0]['server'], leaveRows[0]['con']
+        roster = loadOnlineRoster(con)
+        text = formatPlayerChangesMsg(server, [row['payload']['event'] for row in leaveRows], list(roster.values()))
+        items.append((leaveRows[0]['created'], server, text, leaveRows))
+    for created, server, text, itemRows in sorted(items, key=lambda item: item[0]):
+        yield server, text, itemRows
+
+
+def isOnlineElsewhere(row, cons):
+    sqlSelect = f"SELECT 1 FROM \"{playerTable}\" WHERE \"steamId\" = ? AND online_now = 1;"
+    for server, con in cons:
+        if server['id'] != row['server']['id'] and con.execute(sqlSelect, (row['payload']['event']['steamId'],)).fetchone():
+            return True
+    return False
+
+
+def sendOutboxChat(token, chatId, items):
+    # the messages of one chat, merged and in order. Stops at the first one that has to be retried,
+    # the rest of the chat waits with it. Returns (rows, outcome, retryAfter) per message.
+    results = []
+    parts = groupTelegramMsgs(items)
+    for i, (sendText, rows) in enumerate(parts):
+        outcome, retryAfter = sendTelegramMsg(token, chatId, sendText)
+        if outcome == 'retry':
+            results.append(([row for _, partRows in parts[i:] for row in partRows], outcome, retryAfter))
+            break
+        results.append((rows, outcome, retryAfter))
+    return results
+
+
+def groupTelegramMsgs(items):
+    # join the texts with a blank line, starting a new message when the limit would be exceeded
+    parts = []
+    current = ''
+    currentRows = []
+    for text, rows in items:
+        text = text.strip('\n')[:telegramMaxMsgLength]
+        if current and len(current) + 2 + len(text) > telegramMaxMsgLength:
+            parts.append((current, currentRows))
+            current = ''
+            currentRows = []
+        current = text if not current else current + '\n\n' + text
+        currentRows = currentRows + rows
+    if current:
+        parts.append((current, currentRows))
+    return parts
+
+
+def finishOutboxRows(cons, results, now):
+    # sent, failed and dropped rows are deleted, the others are tried again later. Each database
+    # gets its own short transaction, one that fails (e.g. locked by a long poll) is rolled back
+    # right away instead of holding the write lock until the next drain.
+    sqlDelete = f"DELETE FROM \"{outboxTable}\" WHERE \"id\" = ?;"
+    sqlRetry = f"UPDATE \"{outboxTable}\" SET \"attempts\" = ?, \"next_attempt\" = ? WHERE \"id\" = ?;"
+    statements = dict((server['id'], []) for server, con in cons)
+    for rows, outcome, retryAfter in results:
+        for row in rows:
+            if outcome == 'retry':
+                row['done'] = False
+                row['attempts'] += 1
+                delay = retryAfter or min(outboxBackoffMaxS, 2 ** row['attempts'])
+                row['nextAttempt'] = now + datetime.timedelta(seconds=delay)
+                statements[row['server']['id']].append((sqlRetry, (row['attempts'], row['nextAttempt'], row['id'])))
+            else:
+                row['done'] = True
+                statements[row['server']['id']].append((sqlDelete, (row['id'],)))
+        if outcome != 'finished':
+            registry.inc('outbox_messages_total', result=outcome)
+    for server, con in cons:
+        if len(statements[server['id']]) == 0:
+            continue
+        try:
+            for sql, params in statements[server['id']]:
+                con.execute(sql, params)
+            con.commit()
+        except sqlite3.Error as error:
+            # sent messages that stay in the outbox are sent again, better than losing one
+            con.rollback()
+            registry.inc('outbox_update_errors_total')
+            print(f"Error updating the outbox of server {server['name']}:", error)
+
+
+def getOutboxExecutor():
+    global outboxExecutor
+    if outboxExecutor is None:
+        outboxExecutor = ThreadPoolExecutor(max_workers=telegramMaxParallel, thread_name_prefix='telegram')
+    return outboxExecutor
+
+
+def startOutboxSender(dbDir, servers):
+    # daemon mode: a thread with its own connections sends the outboxes, woken up after every cycle,
+    # so a slow or unreachable Telegram API never delays a poll
+    sender = {'wake': threading.Event(), 'stop': threading.Event()}
+    sender['thread'] = threading.Thread(target=runOutboxSender, args=(dbDir, servers, sender), name='outbox-sender',
+                                        daemon=True)
+    sender['thread'].start()
+    return sender
+
+
+def runOutboxSender(dbDir, servers, sender):
+    cons = [(server, connectDB(os.path.join(dbDir, server['dbname']))) for server in servers]
+    try:
+        while not sender['stop'].is_set():
+            sender['wake'].clear()
+            try:
+                _, nextDue = drainOutbox(cons)
+            except (Exception, SystemExit) as error:
+                print("Error sending notifications:", error)
+                # never keep a write transaction open on a server database between drains
+                for server, con in cons:
+                    con.rollback()
+                nextDue = None
+            waitS = outboxCheckS
+            if nextDue is not None:
+                waitS = min(waitS, max(0.0, (nextDue - clock()).total_seconds()))
+            sender['wake'].wait(waitS)
+    finally:
+        for server, con in cons:
+            con.close()
+
+
+def stopOutboxSender(sender):
+    sender['stop'].set()
+    sender['wake'].set()
+    sender['thread'].join(timeout=30)
+
+
+# one keep-alive http session per bot token and sender thread
+telegramSessions = threading.local()
+
+
+def getTelegramSession(token):
+    # requests is slow to import, only load it when a message is actually sent
+    import requests
+    if not hasattr(telegramSessions, 'byToken'):
+        telegramSessions.byToken = {}
+    if token not in telegramSessions.byToken:
+        telegramSessions.byToken[token] = requests.Session()
+    return telegramSessions.byToken[token]
 
 
-def sendTelegramMsg(server, sendText):
-    telegramUrl = ('https://api.telegram.org/bot' + server['telegrambottoken'] +
-                       '/sendMessage?chat_id=' + server['telegrambotchatid'] + '&parse_mode=Markdown&text=' + sendText)
+def sendTelegramMsg(token, chatId, sendText):
+    # a single attempt, the outbox tries again later. Returns 'sent', 'retry' or 'failed', and the
+    # seconds Telegram asked to wait before retrying, None when it didn't say.
     if printTelegram:
         print(f"Telegram message:\n==========\n{sendText}\n==========\n")
-    if sendTelegram:
+    if not sendTelegram:
+        return 'sent', None
+    import requests
+    telegramUrl = f"{telegramApiUrl}/bot{token}/sendMessage"
+    data = {'chat_id': chatId, 'parse_mode': 'Markdown', 'text': sendText}
+    while True:
         try:
-            response = requests.get(telegramUrl)
+            with registry.timer('telegram_seconds', chat=chatId):
+                response = getTelegramSession(token).post(telegramUrl, data=data, timeout=10)
         except requests.exceptions.RequestException as error:
+            registry.inc('telegram_requests_total', chat=chatId, result='error')
             print("Error sending Telegram notification: ", error)
+            return 'retry', None
+        registry.inc('telegram_requests_total', chat=chatId, result=str(response.status_code))
+        if response.status_code == 200:
+            return 'sent', None
+        try:
+            result = response.json()
+        except ValueError:
+            result = {}
+        if response.status_code == 400 and 'parse' in result.get('description', '') and 'parse_mode' in data:
+            # player names can contain markdown characters, send as plain text instead
+            del data['parse_mode']
+            continue
+        if response.status_code == 429:
+            # rate limited, Telegram tells how long to wait
+            return 'retry', result.get('parameters', {}).get('retry_after')
+        if response.status_code >= 500:
+            return 'retry', None
+        print(f"Error sending Telegram notification: {response.status_code} {result.get('description', '')}")
+        return 'failed', None
 
 
 def totalSecToHourMin(seconds):
@@ -382,16 +1559,554 @@ def printInfo(text):
         print(text)
 
 
-CurrentDir = changeToWorkingDir()
-dbDir = createDbDir("db")
-servers = readConfig()
+def writeCronMetrics():
+    # every cron run starts a new registry, the totals of the earlier runs are kept in a state
+    # file next to the metrics, so the exported counters keep counting up like in daemon mode
+    if not metricsPromFile and not metricsJsonFile:
+        return
+    import fcntl
+    stateFile = (metricsPromFile or metricsJsonFile) + '.state'
+    try:
+        # writestate replaces the state file, so the lock is taken on a file of its own
+        lockFile = open(stateFile + '.lock', 'w')
+    except OSError as error:
+        print("Error writing metrics state:", error)
+        writeMetrics()
+        return
+    with lockFile:
+        # overlapping cron runs take turns, otherwise the counters of one of them are lost
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        total = metrics.Metrics()
+        total.readstate(stateFile)
+        total.merge(registry.export())
+        try:
+            total.writestate(stateFile)
+        except OSError as error:
+            print("Error writing metrics state:", error)
+        writeMetrics(total)
+
+
+def writeMetrics(source=None):
+    source = source or registry
+    try:
+        if metricsPromFile:
+            source.writeprometheus(metricsPromFile)
+        if metricsJsonFile:
+            source.writejson(metricsJsonFile)
+    except OSError as error:
+        print("Error writing metrics:", error)
+
+
+def runConcurrently(func, items, serverOf):
+    # each server gets its own thread, so a server that hangs on the rcon connect
+    # timeout no longer delays the other servers
+    if len(items) == 0:
+        return
+    workers = max(1, min(maxPollWorkers, len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            server = serverOf(futures[future])
+            try:
+                future.result()
+            except (Exception, SystemExit) as error:
+                print(f"Error polling server {server['name']}:", error)
+
+
+def openSession(dbDir, server):
+    con = connectDB(os.path.join(dbDir, server['dbname']))
+    createTable(con, server['id'])
+    rconServer = newRconClient(server)
+    session = {'server': server, 'con': con, 'rcon': rconServer, 'commits': 0, 'roster': None,
+               'online': False, 'changed': False, 'failures': 0, 'nextPoll': 0.0, 'checked': None}
+    return session
+
+
+def commitSession(session):
+    with timed('db_seconds', op='commit'):
+        session['con'].commit()
+    session['commits'] += 1
+
+
+def closeSession(session):
+    session['rcon'].disconnect()
+    session['con'].close()
+
+
+def pollSession(session):
+    # all presence writes of a cycle go into one transaction, chat ingestion follows in its own
+    con = session['con']
+    commitsBefore = session['commits']
+    changesBefore = con.total_changes
+    session['online'] = False
+    session['checked'] = clock()
+    currentServer.name = session['server']['name']
+    pollStart = time.perf_counter()
+    try:
+        rconPlayerList = None
+        changes = []
+        if session['server']['queryport'] is not None:
+            rconPlayerList = probePlayerList(con, session['server'], session)
+        if rconPlayerList is None:
+            rconPlayerList = fetchRconPlayerList(con, session['server'], session['rcon'], session, changes)
+        onlineBefore = None if session['roster'] is None else set(session['roster'])
+        if rconPlayerList is not None:
+            session['roster'] = insertUpdatePlayersDB(con, session['server'], rconPlayerList, session['roster'], changes)
+        session['changed'] = onlineBefore is not None and onlineBefore != set(session['roster'])
+        commitSession(session)
+    except:
+        countMetric('polls_total', result='error')
+        # the snapshot may hold changes that were rolled back, reload it next cycle
+        session['roster'] = None
+        con.rollback()
+        raise
+    if len(changes) > 0:
+        with cycleEventsLock:
+            cycleEvents.append((session['server'], changes))
+    if session['online'] and session['server']['ingestchat']:
+        # after the presence commit, a slow chat reply must not hold the write lock of the cycle
+        try:
+            ingestChat(session)
+        except:
+            countMetric('polls_total', result='error')
+            con.rollback()
+            raise
+    countMetric('polls_total', result='online' if session['online'] else 'offline')
+    countMetric('db_commits_total', session['commits'] - commitsBefore)
+    countMetric('db_rows_written_total', con.total_changes - changesBefore)
+    registry.observe('poll_seconds', time.perf_counter() - pollStart, server=session['server']['name'])
+    # with WAL each commit costs at most one fsync (none with synchronous=NORMAL until a checkpoint)
+    printInfo(f"Server {session['server']['name']}: {con.total_changes - changesBefore} row(s) written "
+              f"in {session['commits'] - commitsBefore} commit(s)")
+
+
+def pollServer(dbDir, server):
+    # the session stays open for sending the outbox
+    session = openSession(dbDir, server)
+    try:
+        pollSession(session)
+    except:
+        closeSession(session)
+        raise
+    return session
+
+
+def pollServers(dbDir, servers):
+    sessions = []
+    runConcurrently(lambda server: sessions.append(pollServer(dbDir, server)), servers, lambda server: server)
+    try:
+        updatePlayerIndex(dbDir)
+        # a server that failed to poll keeps its queued messages for the next run
+        drainOutbox([(session['server'], session['con']) for session in sessions])
+    finally:
+        for session in sessions:
+            closeSession(session)
+    writeCronMetrics()
+
+
+def nextPollDelay(session, intervalS):
+    # unreachable servers back off exponentially, busy servers are polled more often than empty ones
+    if not session['online']:
+        session['failures'] += 1
+        # the exponent is capped, failures keeps counting while a server stays unreachable for weeks
+        delay = min(pollBackoffMaxS, intervalS * 2 ** min(session['failures'] - 1, 16))
+    else:
+        session['failures'] = 0
+        if session['changed']:
+            delay = min(pollIntervalFastS, intervalS)
+        elif session['roster']:
+            delay = intervalS
+        else:
+            delay = max(pollIntervalIdleS, intervalS)
+    return delay * random.uniform(1 - pollJitter, 1 + pollJitter)
+
+
+def runDaemon(dbDir, servers, intervalS, onCycle=None, sendOutbox=True):
+    # keep the sqlite connections and authenticated rcon sessions open between cycles,
+    # so a poll costs a single listplayers round trip. Each server has its own next poll time.
+    # onCycle is called with all sessions and the polled ones after every cycle. The outbox is
+    # sent by a thread of its own, unless sendOutbox is False (a worker process, the
+    # coordinator sends).
+    sessions = [openSession(dbDir, server) for server in servers]
+    sender = startOutboxSender(dbDir, servers) if sendOutbox else None
+    print(f"Daemon started, polling {len(sessions)} server(s) every {intervalS} seconds")
+    try:
+        while len(sessions) > 0:
+            due = [session for session in sessions if session['nextPoll'] <= time.monotonic()]
+            if len(due) > 0:
+                runConcurrently(pollSession, due, lambda session: session['server'])
+                updatePlayerIndex(dbDir)
+                if sender is not None:
+                    sender['wake'].set()
+                writeMetrics()
+                for session in due:
+                    delay = nextPollDelay(session, intervalS)
+                    session['nextPoll'] = time.monotonic() + delay
+                    printInfo(f"Server {session['server']['name']}: next poll in {delay:.0f} seconds")
+                if onCycle is not None:
+                    onCycle(sessions, due)
+            wakeAt = min(session['nextPoll'] for session in sessions)
+            time.sleep(max(0.0, wakeAt - time.monotonic()))
+    except KeyboardInterrupt:
+        print("Daemon stopped")
+    finally:
+        if sender is not None:
+            stopOutboxSender(sender)
+        for session in sessions:
+            closeSession(session)
+        closeIndexDb()
+
+
+def runReplay(servers, args):
+    # feed recorded listplayers replies through the presence engine into scratch databases,
+    # on a virtual clock so a month of traffic replays in seconds. Telegram is never called.
+    global clock, sendTelegram, printTelegram
+    import tempfile
+    dbDir = createDbDir(args.replay_db or tempfile.mkdtemp(prefix='ark-replay-'))
+    sendTelegram = False
+    printTelegram = printTelegram or args.print_messages
+    configured = {int(server['id']): server for server in servers}
+    sessions = {}
+    traces = {}
+    for i, path in enumerate(args.replay, 1):
+        result = re.search(r"(\d+)\.trace$", path)
+        serverId = int(result.group(1)) if result is not None else i
+        server = dict(configured.get(serverId, {'name': f"replay-{serverId}", 'rconip': '', 'rconport': 0,
+                                                'rconpass': '', 'telegrambottoken': '', 'telegrambotchatid': ''}))
+        server.update(id=str(serverId), dbname="ark-%02d.db" % serverId, queryport=None, ingestchat=False)
+        knownServers[serverId] = server
+        session = openSession(dbDir, server)
+        session['rcon'] = rcontrace.ReplayClient()
+        sessions[serverId] = session
+        traces[serverId] = path
+    replayTime = {'now': None}
+    clock = lambda: replayTime['now']
+    print(f"Replaying {len(traces)} trace(s) into {dbDir}")
+    entries = messages = 0
+    first = None
+    started = time.perf_counter()
+    try:
+        for t, serverId, online, reply in rcontrace.mergetraces(traces):
+            if args.speed > 0 and replayTime['now'] is not None:
+                time.sleep(max(0.0, (t - replayTime['now']).total_seconds() / args.speed))
+            replayTime['now'] = t
+            first = first or t
+            session = sessions[serverId]
+            session['rcon'].reply = reply
+            try:
+                pollSession(session)
+            except (Exception, SystemExit) as error:
+                print(f"Error replaying entry of server {session['server']['name']} at {t}:", error)
+            entries += 1
+            updatePlayerIndex(dbDir)
+            sent, _ = drainOutbox([(session['server'], session['con']) for session in sessions.values()])
+            messages += sent
+    finally:
+        rowsWritten = sum(session['con'].total_changes for session in sessions.values())
+        for session in sessions.values():
+            closeSession(session)
+        closeIndexDb()
+        clock = datetime.datetime.now
+    elapsed = time.perf_counter() - started
+    writeMetrics()
+    if entries == 0:
+        print("Nothing to replay")
+        return
+    span = (replayTime['now'] - first).total_seconds()
+    print(f"Replayed {entries} entries covering {totalSecToHourMin(int(span))} in {elapsed:.2f} seconds "
+          f"({entries / elapsed:.0f} entries/s, {span / elapsed:.0f}x real time), "
+          f"{messages} notification(s), {rowsWritten} row(s) written")
+
+
+def shardServers(servers, workers):
+    # by server id, so a server and its sqlite file always belong to the same worker
+    shards = [[] for _ in range(workers)]
+    for server in servers:
+        shards[int(server['id']) % workers].append(server)
+    return [shard for shard in shards if len(shard) > 0]
 
-for server in servers:
-    # print(f"==== Server {server['id']}: {server['name']} ====")
-    # print(json.dumps(server, indent=4))
-    con = connectDB(os.path.join(dbDir,server['dbname']))
-    createTable(con,server['id'])
-    insertUpdatePlayersDB(con, server, fetchRconPlayerList(con, server))
+
+def runWorker(worker, dbDir, servers, intervalS, results, recordDirectory):
+    # one worker process of a sharded daemon, reports to the coordinator after every cycle
+    global metricsPromFile, metricsJsonFile, recorder, registry
+    # Ctrl-C reaches the whole process group, the coordinator stops the workers with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, stopBySignal)
+    # the coordinator writes the metrics, merged with its own counters
+    metricsPromFile = metricsJsonFile = None
+    registry = metrics.Metrics()
+    recorder = rcontrace.Recorder(recordDirectory) if recordDirectory else None
+
+    def report(sessions, due):
+        results.put({'worker': worker, 'pid': os.getpid(), 'time': time.time(), 'polled': len(due),
+                     'servers': [serverStatus(session) for session in sessions],
+                     'metrics': registry.export()})
+
+    runDaemon(dbDir, servers, intervalS, report, sendOutbox=False)
+
+
+def stopBySignal(signum, frame):
+    # a SIGTERM sent to the whole process group reaches a worker twice, from the signal and
+    # from the coordinator. Ignore the second one so it can't interrupt the cleanup.
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+
+def startWorker(context, worker, dbDir, shard, intervalS, results):
+    # everything runWorker needs is passed, the process starts from a fresh import of the script
+    process = context.Process(target=runWorker, name=f"arkserver-worker-{worker}", daemon=True,
+                              args=(worker, dbDir, shard, intervalS, results, recorder.directory if recorder else None))
+    process.start()
+    return process
+
+
+def runCoordinator(dbDir, servers, intervalS, workers):
+    # sharded daemon: each worker process polls its own servers, so parsing, sqlite and
+    # Telegram use all cores. The coordinator merges their metrics and restarts crashed workers.
+    import multiprocessing
+    # forkserver: the workers, also the ones restarted later, are forked from a single threaded
+    # server process. Forking the coordinator itself could copy a lock held by one of its threads
+    # (outbox sender, status API) into the worker and deadlock it.
+    context = multiprocessing.get_context('forkserver')
+    shards = shardServers(servers, workers)
+    # the coordinator sends the outboxes of all servers, so a leave on one worker's server and a
+    # join on another's still merge into one transfer. The tables must exist before it opens them.
+    for server in servers:
+        con = connectDB(os.path.join(dbDir, server['dbname']))
+        createTable(con, server['id'])
+        con.close()
+    results = context.Queue()
+    processes = [startWorker(context, worker, dbDir, shard, intervalS, results) for worker, shard in enumerate(shards)]
+    sender = startOutboxSender(dbDir, servers)
+    restartedAt = [0.0] * len(shards)
+    workerMetrics = {}
+    workerServers = {}
+    signal.signal(signal.SIGTERM, stopBySignal)
+    print(f"Coordinator started, {len(servers)} server(s) over {len(shards)} worker process(es)")
+    try:
+        while True:
+            try:
+                result = results.get(timeout=1.0)
+            except queue.Empty:
+                result = None
+            if result is not None:
+                sender['wake'].set()
+                workerMetrics[result['worker']] = result['metrics']
+                workerServers[result['worker']] = result['servers']
+                publishStatus([server for servers in workerServers.values() for server in servers])
+                online = sum(1 for server in result['servers'] if server['online'])
+                players = sum(server['player_count'] for server in result['servers'])
+                printInfo(f"Worker {result['worker']} (pid {result['pid']}): polled {result['polled']} server(s), "
+                          f"{online}/{len(result['servers'])} online, {players} player(s)")
+                merged = metrics.Metrics()
+                merged.merge(registry.export())
+                for exported in workerMetrics.values():
+                    merged.merge(exported)
+                writeMetrics(merged)
+            for worker, process in enumerate(processes):
+                if process.is_alive() or time.monotonic() - restartedAt[worker] < workerRestartDelayS:
+                    continue
+                print(f"Worker {worker} (pid {process.pid}) exited with code {process.exitcode}, restarting it")
+                registry.inc('worker_restarts_total', worker=str(worker))
+                # counters start from zero in the new process
+                workerMetrics.pop(worker, None)
+                restartedAt[worker] = time.monotonic()
+                processes[worker] = startWorker(context, worker, dbDir, shards[worker], intervalS, results)
+    except KeyboardInterrupt:
+        print("Coordinator stopped")
+    finally:
+        # the workers close their sessions on SIGTERM
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+        stopOutboxSender(sender)
+
+
+def serverStatus(session):
+    # what the status API shows of a server, plain data so workers can send it to the coordinator
+    players = sorted((session['roster'] or {}).items(), key=lambda item: item[1]['lastLogon'] or datetime.datetime.min)
+    return {'id': int(session['server']['id']), 'name': session['server']['name'], 'online': session['online'],
+            'checked': None if session['checked'] is None else session['checked'].isoformat(timespec='seconds'),
+            'player_count': len(players),
+            'players': [{'steamId': steamId, 'name': player['name'],
+                         'since': None if player['lastLogon'] is None else player['lastLogon'].isoformat(timespec='seconds')}
+                        for steamId, player in players]}
+
+
+def publishStatus(servers):
+    # serialize once per cycle, requests only send the prepared bytes
+    global statusDocs
+    import hashlib
+    servers = sorted(servers, key=lambda server: server['id'])
+    docs = {'/servers': {'generated': clock().isoformat(timespec='seconds'), 'servers': servers}}
+    for server in servers:
+        docs[f"/servers/{server['id']}"] = server
+    prepared = {}
+    for path, doc in docs.items():
+        body = json.dumps(doc, separators=(',', ':')).encode('utf-8')
+        prepared[path] = (body, '"%s"' % hashlib.sha1(body).hexdigest()[:20])
+    statusDocs = prepared
+
+
+def startStatusServer(host, port):
+    # read-only: answers from statusDocs, never touches sqlite or rcon
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?', 1)[0].rstrip('/') or '/servers'
+            doc = statusDocs.get(path)
+            if doc is None:
+                self.sendBody(404, b'{"error":"not found"}')
+                return
+            body, etag = doc
+            match = [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]
+            if etag in match or '*' in match:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.sendBody(200, body, etag)
+
+        def sendBody(self, status, body, etag=None):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-cache')
+            if etag is not None:
+                self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            printInfo(f"Status API: {self.address_string()} {format % args}")
+
+    httpServer = ThreadingHTTPServer((host, port), StatusHandler)
+    httpServer.daemon_threads = True
+    threading.Thread(target=httpServer.serve_forever, name='status-api', daemon=True).start()
+    print(f"Status API listening on http://{host}:{port}/servers")
+    return httpServer
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Send Telegram notifications when players join or leave ARK servers.")
+    parser.add_argument('--daemon', action='store_true',
+                        help="keep running and poll on an internal timer instead of once (cron)")
+    parser.add_argument('--interval', type=float, default=daemonIntervalS,
+                        help=f"seconds between polls in daemon mode while players are online, empty, busy and "
+                             f"unreachable servers are polled slower or faster from there (default {daemonIntervalS})")
+    parser.add_argument('--status-port', type=int, default=statusPort,
+                        help=f"daemon mode: serve the latest status of all servers as JSON on {statusHost}:PORT")
+    parser.add_argument('--workers', type=int, default=daemonWorkers,
+                        help=f"daemon mode: poll the servers from this many processes, each server is always "
+                             f"polled by the same process (default {daemonWorkers})")
+    parser.add_argument('--metrics-prom', metavar='PATH', default=metricsPromFile,
+                        help="write metrics as a Prometheus textfile to PATH after every poll cycle")
+    parser.add_argument('--metrics-json', metavar='PATH', default=metricsJsonFile,
+                        help="write metrics as a JSON snapshot to PATH after every poll cycle")
+    parser.add_argument('--record', metavar='DIR', type=os.path.abspath, default=recordDir,
+                        help="append every listplayers reply to a trace file per server in DIR")
+    parser.add_argument('--replay', nargs='+', metavar='TRACE', type=os.path.abspath,
+                        help="replay recorded traces (ark-NN.trace) into scratch databases instead of polling")
+    parser.add_argument('--speed', type=float, default=0,
+                        help="replay at this many times real time (default 0, as fast as possible)")
+    parser.add_argument('--replay-db', metavar='DIR', type=os.path.abspath,
+                        help="directory for the databases written by --replay (default a new temporary directory)")
+    parser.add_argument('--print-messages', action='store_true',
+                        help="print the notifications produced by --replay")
+    parser.add_argument('--whereis', type=int, metavar='STEAMID',
+                        help="show on which server a player is online or was last seen, and the playtime per server")
+    parser.add_argument('--search-chat', metavar='QUERY',
+                        help="search the stored chat and game log lines of all servers, or of --server")
+    parser.add_argument('--server', type=int,
+                        help="server id of the [server:N] section to report on")
+    parser.add_argument('--playtime', type=int, metavar='STEAMID',
+                        help="report playtime per day of this player on --server, between --since and --until")
+    parser.add_argument('--day', type=parseDate,
+                        help="report playtime per player and peak concurrency on --server for this day (YYYY-MM-DD)")
+    parser.add_argument('--since', type=parseDate,
+                        help="start date for --playtime (YYYY-MM-DD, default 7 days ago)")
+    parser.add_argument('--until', type=parseDate,
+                        help="end date for --playtime, exclusive (YYYY-MM-DD, default tomorrow)")
+    parser.add_argument('--compact', action='store_true',
+                        help=f"prune sessions older than {historyRetentionDays} days and rollups older than "
+                             f"{rollupRetentionDays} days from all server databases, then vacuum")
+    args = parser.parse_args()
+    if (args.playtime is not None or args.day is not None) and args.server is None:
+        parser.error("--playtime and --day need --server")
+    if args.status_port is not None and not args.daemon:
+        parser.error("--status-port needs --daemon")
+    return args
+
+
+def parseDate(value):
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date \"{value}\", use YYYY-MM-DD")
+
+
+def runReport(dbDir, args):
+    con = connectDB(os.path.join(dbDir, "ark-%02d.db" % args.server))
+    createTable(con, args.server)
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    if args.playtime is not None:
+        since = args.since or today - datetime.timedelta(days=7)
+        until = args.until or today + datetime.timedelta(days=1)
+        printPlayerPlaytime(con, args.playtime, since, until)
+    if args.day is not None:
+        printDayPlaytime(con, args.day.date())
     con.close()
-    
-exit()
\ No newline at end of file
+
+
+def runCompact(dbDir, servers):
+    for server in servers:
+        con = connectDB(os.path.join(dbDir, server['dbname']))
+        createTable(con, server['id'])
+        sessions = compactHistory(con)
+        con.close()
+        print(f"Server {server['name']}: pruned {sessions} session(s)")
+
+
+def main():
+    global metricsPromFile, metricsJsonFile, recorder
+    args = parseArgs()
+    metricsPromFile = args.metrics_prom
+    metricsJsonFile = args.metrics_json
+    if args.record:
+        recorder = rcontrace.Recorder(args.record)
+    changeToWorkingDir()
+    dbDir = createDbDir("db")
+    servers = readConfig()
+    knownServers.update((int(server['id']), server) for server in servers)
+    if args.replay:
+        runReplay(servers, args)
+    elif args.whereis is not None:
+        printWhereIs(getIndexDb(dbDir), args.whereis)
+        closeIndexDb()
+    elif args.search_chat is not None:
+        printChatSearch(dbDir, [server for server in servers if args.server in (None, int(server['id']))],
+                        args.search_chat)
+    elif args.playtime is not None or args.day is not None:
+        runReport(dbDir, args)
+    elif args.compact:
+        runCompact(dbDir, servers)
+    elif args.daemon:
+        if args.status_port is not None:
+            publishStatus([])
+            startStatusServer(statusHost, args.status_port)
+        if args.workers > 1:
+            runCoordinator(dbDir, servers, args.interval, args.workers)
+        else:
+            runDaemon(dbDir, servers, args.interval,
+                      lambda sessions, due: publishStatus([serverStatus(session) for session in sessions]))
+    else:
+        pollServers(dbDir, servers)
+
+
+if __name__ == '__main__':
+    main()
+    exit()
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+#
+# End to end benchmark of the poll path: N fake RCON servers x M players and a fake
+# Telegram endpoint run in a child process, the real notifier code polls them.
+# Reports cycle latency percentiles, throughput, db writes, Telegram calls and peak
+# memory, and saves the results to benchmarks/results/ so runs can be compared.
+#
+# Run from the repository root, for example:
+#   python benchmarks/bench_poll.py --servers 20 --players 50 --cycles 30 --latency 0.02
+#   python benchmarks/bench_poll.py --mode daemon --compare benchmarks/results/<earlier>.json
+
+import argparse
+import datetime
+import importlib.util
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+repoDir = os.path.dirname(benchDir)
+sys.path.insert(0, repoDir)
+sys.path.insert(0, benchDir)
+import fakeservers
+
+
+def loadNotifier():
+    # the script has a dash in its name, load it as a module without running main()
+    spec = importlib.util.spec_from_file_location('arkservernotify', os.path.join(repoDir, 'arkserver-notify.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def runFakes(args, ready, stop):
+    # runs in a child process so the fakes don't share memory or the GIL with the notifier
+    servers = []
+    for i in range(args.servers):
+        failure = 'down' if i < int(args.servers * args.fail_ratio) else None
+        rcon = fakeservers.FakeRconServer(players=args.players, churn=args.churn, latency=args.latency,
+                                          split=args.split, failure=failure, seed=i + 1, chat=args.chat,
+                                          backlog=args.chat_backlog)
+        queryPort = fakeservers.FakeA2SServer(rcon).start() if args.queryport else None
+        servers.append({'rconport': rcon.start(), 'queryport': queryPort, 'rconpass': rcon.password})
+    telegram = fakeservers.FakeTelegramServer(latency=args.telegram_latency, rateLimitEvery=args.rate_limit_every)
+    telegram.start()
+    ready.put({'servers': servers, 'telegramUrl': telegram.url()})
+    stop.wait()
+    ready.put({'telegramMessages': len(telegram.messages), 'telegramCalls': telegram.calls})
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def counterTotal(registry, name):
+    return sum(counter['value'] for counter in registry.snapshot()['counters'] if counter['name'] == registry.prefix + name)
+
+
+def bench(args):
+    ready = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    fakes = multiprocessing.Process(target=runFakes, args=(args, ready, stop), daemon=True)
+    fakes.start()
+    setup = ready.get(timeout=30)
+
+    notifier = loadNotifier()
+    notifier.sendTelegram = True
+    notifier.printTelegram = False
+    notifier.printInfoToScreen = False
+    notifier.telegramApiUrl = setup['telegramUrl']
+    notifier.maxPollWorkers = args.workers
+    dbDir = tempfile.mkdtemp(prefix='arkbench-')
+    servers = []
+    for i, fake in enumerate(setup['servers']):
+        servers.append({'id': str(i + 1), 'name': f"Bench {i + 1:03d}", 'dbname': "ark-%02d.db" % (i + 1),
+                        'rconip': '127.0.0.1', 'rconport': fake['rconport'], 'rconpass': fake['rconpass'],
+                        'queryport': fake['queryport'], 'telegrambottoken': 'bench',
+                        'telegrambotchatid': f"chat{i % args.chats}",
+                        'ingestchat': args.chat > 0 or args.chat_backlog > 0, 'chatalertkeywords': []})
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    sessions = None
+    if args.mode == 'daemon':
+        sessions = [notifier.openSession(dbDir, server) for server in servers]
+    cycleTimes = []
+    start = time.perf_counter()
+    for cycle in range(args.cycles):
+        cycleStart = time.perf_counter()
+        if sessions is None:
+            notifier.pollServers(dbDir, servers)
+        else:
+            notifier.runConcurrently(notifier.pollSession, sessions, lambda session: session['server'])
+            notifier.updatePlayerIndex(dbDir)
+            notifier.drainOutbox([(session['server'], session['con']) for session in sessions])
+        cycleTimes.append(time.perf_counter() - cycleStart)
+    elapsed = time.perf_counter() - start
+    peakTraced = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    if sessions is not None:
+        for session in sessions:
+            notifier.closeSession(session)
+
+    stop.set()
+    telegram = ready.get(timeout=30)
+    fakes.join(timeout=10)
+
+    registry = notifier.registry
+    return {
+        'cycle_p50_ms': percentile(cycleTimes, 50) * 1000,
+        'cycle_p90_ms': percentile(cycleTimes, 90) * 1000,
+        'cycle_p99_ms': percentile(cycleTimes, 99) * 1000,
+        'cycle_max_ms': max(cycleTimes) * 1000,
+        'polls_per_s': args.servers * args.cycles / elapsed,
+        'db_commits': counterTotal(registry, 'db_commits_total'),
+        'db_rows_written': counterTotal(registry, 'db_rows_written_total'),
+        'telegram_messages': telegram['telegramMessages'],
+        'telegram_calls': telegram['telegramCalls'],
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        'peak_traced_mb': None if peakTraced is None else peakTraced / 1024.0 / 1024.0,
+    }
+
+
+def gitRevision():
+    try:
+        return subprocess.check_output(['git', '-C', repoDir, 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def printResults(results, previous=None):
+    for key, value in results.items():
+        line = f"{key:20s} {value if value is None else round(value, 2)!s:>12}"
+        if previous is not None and previous.get(key) not in (None, 0) and value is not None:
+            line += f"   was {round(previous[key], 2):>10} ({(value - previous[key]) / previous[key] * 100:+.1f}%)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the poll path against local fake servers")
+    parser.add_argument('--servers', type=int, default=10)
+    parser.add_argument('--players', type=int, default=30, help="players online per server")
+    parser.add_argument('--churn', type=float, default=0.1, help="fraction of players replaced per poll")
+    parser.add_argument('--cycles', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.0, help="rcon reply latency in seconds")
+    parser.add_argument('--split', type=int, default=fakeservers.MAX_BODY, help="max body bytes per rcon packet")
+    parser.add_argument('--fail-ratio', type=float, default=0.0, help="fraction of servers that are down")
+    parser.add_argument('--queryport', action='store_true', help="give servers an A2S query port")
+    parser.add_argument('--chats', type=int, default=1, help="number of Telegram chats the servers share")
+    parser.add_argument('--chat', type=int, default=0,
+                        help="chat and game log lines per server and poll, turns on chat ingestion")
+    parser.add_argument('--chat-backlog', type=int, default=0,
+                        help="chat and game log lines of the first poll, like after a server restart")
+    parser.add_argument('--telegram-latency', type=float, default=0.0)
+    parser.add_argument('--rate-limit-every', type=int, default=0, help="answer every Nth Telegram call with 429")
+    parser.add_argument('--workers', type=int, default=8, help="maxPollWorkers")
+    parser.add_argument('--mode', choices=['cron', 'daemon'], default='cron',
+                        help="cron: new connections every cycle, daemon: persistent sessions")
+    parser.add_argument('--tracemalloc', action='store_true', help="also report peak traced Python memory (slower)")
+    parser.add_argument('--label', default='', help="name added to the results file")
+    parser.add_argument('--compare', metavar='RESULTS', help="earlier results file to compare with")
+    args = parser.parse_args()
+
+    print(f"{args.servers} servers x {args.players} players, {args.cycles} {args.mode} cycles")
+    results = bench(args)
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+    printResults(results, previous)
+
+    resultsDir = os.path.join(benchDir, 'results')
+    os.makedirs(resultsDir, exist_ok=True)
+    name = datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + (f"-{args.label}" if args.label else '') + '.json'
+    with open(os.path.join(resultsDir, name), 'w') as f:
+        json.dump({'revision': gitRevision(), 'params': vars(args), 'results': results}, f, indent=1)
+    print(f"Saved to {os.path.join(resultsDir, name)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+#
+# Microbenchmark for SourceRcon.receive: time and peak memory per MB of reply,
+# comparing the buffered receive path with the original bytes concatenation one.
+#
+# Run from the repository root: python benchmarks/bench_srcds_receive.py [MB]
+
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import srcds
+
+PACKET_BODY = srcds.MAX_MESSAGE_LENGTH - 4 - 4 - 1 - 1
+
+
+class LegacySourceRcon(srcds.SourceRcon):
+    """SourceRcon with the original receive loop, kept here as the baseline."""
+    def receive(self):
+        packetsize = False
+        requestid = False
+        response = False
+        message = b''
+        message2 = b''
+
+        while 1:
+            buf = b''
+
+            while len(buf) < 4:
+                try:
+                    recv = self.tcp.recv(4 - len(buf))
+                    if not len(recv):
+                        raise srcds.SourceRconError('RCON connection unexpectedly closed by remote host')
+                    buf += recv
+                except srcds.SourceRconError:
+                    raise
+                except:
+                    break
+
+            if len(buf) != 4:
+                break
+
+            packetsize = struct.unpack('<l', buf)[0]
+
+            buf = b''
+
+            while len(buf) < packetsize:
+                try:
+                    recv = self.tcp.recv(packetsize - len(buf))
+                    if not len(recv):
+                        raise srcds.SourceRconError('RCON connection unexpectedly closed by remote host')
+                    buf += recv
+                except srcds.SourceRconError:
+                    raise
+                except:
+                    break
+
+            requestid = struct.unpack('<l', buf[:4])[0]
+            response = struct.unpack('<l', buf[4:8])[0]
+
+            str1 = buf[8:]
+            pos1 = str1.index(b'\x00')
+            str2 = str1[pos1+1:]
+            pos2 = str2.index(b'\x00')
+
+            message += str1[:pos1]
+            message2 += str2[:pos2]
+
+            poll = srcds.select.select([self.tcp], [], [], 0)
+
+            if not len(poll[0]) and packetsize < srcds.PROBABLY_SPLIT_IF_LARGER_THAN:
+                break
+
+        return message
+
+
+def buildReply(sizeMB):
+    # a listplayers style reply split into full packets plus one short last packet
+    line = b"123. Some ARK player name, 76561190000000123\n"
+    body = (line * (sizeMB * 1024 * 1024 // len(line) + 1))[:sizeMB * 1024 * 1024 - 100]
+    packets = []
+    for i in range(0, len(body), PACKET_BODY):
+        data = struct.pack('<ll', 1, srcds.SERVERDATA_RESPONSE_VALUE) + body[i:i+PACKET_BODY] + b'\x00\x00'
+        packets.append(struct.pack('<l', len(data)) + data)
+    return b''.join(packets), len(body)
+
+
+def runOnce(clientClass, wire, trace):
+    serverSock, clientSock = socket.socketpair()
+    clientSock.settimeout(1.0)
+    client = clientClass('127.0.0.1')
+    client.tcp = clientSock
+    client.reqid = 1
+    writer = threading.Thread(target=serverSock.sendall, args=(wire,))
+    writer.start()
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    reply = client.receive()
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    writer.join()
+    serverSock.close()
+    clientSock.close()
+    return elapsed, peak, len(reply)
+
+
+def main():
+    sizeMB = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    wire, bodyLen = buildReply(sizeMB)
+    print(f"Reply of {bodyLen / 1024 / 1024:.2f} MB in {len(wire) // srcds.MAX_MESSAGE_LENGTH + 1} packets")
+    for label, clientClass in (('before (bytes +=)', LegacySourceRcon), ('after (recv_into)', srcds.SourceRcon)):
+        timings = []
+        for i in range(5):
+            elapsed, peak, replyLen = runOnce(clientClass, wire, False)
+            timings.append(elapsed)
+            assert replyLen == bodyLen, f"{label}: got {replyLen} of {bodyLen} bytes"
+        elapsed, peak, replyLen = runOnce(clientClass, wire, True)
+        perMB = min(timings) / (bodyLen / 1024 / 1024)
+        print(f"{label}: {perMB * 1000:8.2f} ms/MB, peak allocated {peak / (bodyLen):6.2f} bytes per reply byte")
+
+
+if __name__ == '__main__':
+    main()
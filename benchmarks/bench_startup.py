@@ -0,0 +1,135 @@
+#!/usr/bin/python
+#
+# Cold start benchmark of cron mode: runs the notifier as a new process, like cron does,
+# against fake RCON servers and reports interpreter startup, import time and the wall
+# time of complete runs. Results are saved to benchmarks/results/ like bench_poll.py.
+#
+# Run from the repository root, for example:
+#   python benchmarks/bench_startup.py --servers 10 --runs 20
+#   python benchmarks/bench_startup.py --compare benchmarks/results/<earlier>.json
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+repoDir = os.path.dirname(benchDir)
+sys.path.insert(0, benchDir)
+import fakeservers
+from bench_poll import runFakes, percentile, gitRevision, printResults
+
+scriptFiles = ['arkserver-notify.py', 'srcds.py', 'a2s.py', 'metrics.py', 'rcontrace.py', 'gamelog.py']
+
+
+def setupWorkDir(setup):
+    # a copy of the script next to its config.ini, the script changes to its own directory
+    workDir = tempfile.mkdtemp(prefix='arkstartup-')
+    for name in scriptFiles:
+        if os.path.exists(os.path.join(repoDir, name)):
+            shutil.copy(os.path.join(repoDir, name), workDir)
+    script = os.path.join(workDir, 'arkserver-notify.py')
+    with open(script) as f:
+        source = f.read()
+    # never talk to the real Telegram API
+    source = re.sub(r"^telegramApiUrl = .*$", f"telegramApiUrl = '{setup['telegramUrl']}'", source, flags=re.M)
+    with open(script, 'w') as f:
+        f.write(source)
+    with open(os.path.join(workDir, 'config.ini'), 'w') as f:
+        for i, fake in enumerate(setup['servers']):
+            f.write(f"[server:{i + 1}]\nname = Bench {i + 1:03d}\nrconIp = 127.0.0.1\nrconPort = {fake['rconport']}\n"
+                    f"rconPass = {fake['rconpass']}\ntelegramBotToken = bench\ntelegramBotChatId = chat\n\n")
+    return script
+
+
+def timeRun(command):
+    start = time.perf_counter()
+    subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def importTimes(script):
+    # -X importtime lists every import with its cumulative time in microseconds,
+    # the top level imports (no indentation) add up to the total
+    output = subprocess.run([sys.executable, '-X', 'importtime', script, '--help'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True).stderr.decode()
+    imports = {}
+    for line in output.splitlines():
+        result = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S.*)$", line)
+        if result is not None:
+            imports[result.group(2)] = int(result.group(1))
+    return imports
+
+
+def bench(args):
+    ready = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    fakes = multiprocessing.Process(target=runFakes, args=(args, ready, stop), daemon=True)
+    fakes.start()
+    setup = ready.get(timeout=30)
+    script = setupWorkDir(setup)
+
+    # the first run creates the databases and announces everybody, not part of the measurement
+    timeRun([sys.executable, script])
+    interpreter = [timeRun([sys.executable, '-c', 'pass']) for _ in range(args.runs)]
+    runs = [timeRun([sys.executable, script]) for _ in range(args.runs)]
+    imports = [importTimes(script) for _ in range(min(args.runs, 5))]
+
+    stop.set()
+    ready.get(timeout=30)
+    fakes.join(timeout=10)
+
+    totals = [sum(imported.values()) for imported in imports]
+    slowest = sorted(imports[0].items(), key=lambda item: -item[1])[:args.top]
+    return {
+        'interpreter_ms': percentile(interpreter, 50) * 1000,
+        'imports_ms': percentile(totals, 50) / 1000.0,
+        'run_p50_ms': percentile(runs, 50) * 1000,
+        'run_p90_ms': percentile(runs, 90) * 1000,
+        'run_min_ms': min(runs) * 1000,
+    }, slowest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cold start of cron mode")
+    parser.add_argument('--servers', type=int, default=10)
+    parser.add_argument('--players', type=int, default=10, help="players online per server")
+    parser.add_argument('--churn', type=float, default=0.0, help="fraction of players replaced per poll")
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--top', type=int, default=8, help="number of slowest top level imports to list")
+    parser.add_argument('--label', default='', help="name added to the results file")
+    parser.add_argument('--compare', metavar='RESULTS', help="earlier results file to compare with")
+    args = parser.parse_args()
+    # settings of the fakes that bench_poll.py makes configurable
+    args.latency, args.split, args.fail_ratio, args.queryport = 0.0, fakeservers.MAX_BODY, 0.0, False
+    args.telegram_latency, args.rate_limit_every = 0.0, 0
+    args.chat, args.chat_backlog = 0, 0
+
+    print(f"{args.servers} servers x {args.players} players, {args.runs} cron runs")
+    results, slowest = bench(args)
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+    printResults(results, previous)
+    print("Slowest top level imports:")
+    for name, microseconds in slowest:
+        print(f"  {name:30s} {microseconds / 1000.0:8.2f} ms")
+
+    resultsDir = os.path.join(benchDir, 'results')
+    os.makedirs(resultsDir, exist_ok=True)
+    name = datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '-startup' + (f"-{args.label}" if args.label else '') + '.json'
+    with open(os.path.join(resultsDir, name), 'w') as f:
+        json.dump({'revision': gitRevision(), 'params': vars(args), 'results': results}, f, indent=1)
+    print(f"Saved to {os.path.join(resultsDir, name)}")
+
+
+if __name__ == '__main__':
+    main()
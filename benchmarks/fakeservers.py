@@ -0,0 +1,244 @@
+#!/usr/bin/python
+#
+# Local stand-ins for the game servers and Telegram, for benchmarks and manual testing:
+# - FakeRconServer speaks Source RCON (auth, exec, empty sentinel commands) and answers
+#   listplayers with a player list that churns between calls, and getchat/getgamelog
+#   with new lines on every call
+# - FakeA2SServer answers A2S_INFO with the current player count of a FakeRconServer
+# - FakeTelegramServer accepts sendMessage calls and counts them
+#
+# Run standalone: python benchmarks/fakeservers.py --servers 3 --players 40
+
+import argparse
+import http.server
+import json
+import random
+import socket
+import socketserver
+import struct
+import threading
+import time
+import urllib.parse
+
+SERVERDATA_AUTH = 3
+SERVERDATA_AUTH_RESPONSE = 2
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_RESPONSE_VALUE = 0
+MAX_BODY = 4095  # a Source server sends at most 4096 bytes of string, the terminating null included
+
+
+class FakeRconServer(socketserver.ThreadingTCPServer):
+    """Source RCON server on 127.0.0.1.
+
+       players   number of players online
+       churn     fraction of the players replaced on every listplayers call
+       chat      chat lines and game log lines returned by every getchat and getgamelog call
+       backlog   lines returned by the first getchat and getgamelog call, like after a restart
+       latency   seconds to wait before every reply
+       split     maximum body bytes per reply packet, larger replies are split
+       failure   None, 'badpass' (reject auth), 'hang' (accept but never answer)
+                 or 'down' (close connections right away)
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, password='benchpass', players=10, churn=0.0, latency=0.0, split=MAX_BODY,
+                 failure=None, seed=1, chat=0, backlog=0):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', port), FakeRconHandler)
+        self.password = password
+        self.churn = churn
+        self.latency = latency
+        self.split = split
+        self.failure = failure
+        self.chat = chat
+        self.backlog = {'getchat': backlog, 'getgamelog': backlog}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.nextSteamId = 76561190000000000 + seed * 1000000
+        self.online = {}
+        self.requests = 0
+        for i in range(players):
+            self.join()
+
+    def join(self):
+        self.nextSteamId += 1
+        self.online[self.nextSteamId] = f"Player {self.nextSteamId % 1000000}"
+
+    def listplayers(self):
+        with self.lock:
+            self.requests += 1
+            changes = int(round(len(self.online) * self.churn))
+            for steamId in self.random.sample(sorted(self.online), changes):
+                del self.online[steamId]
+                self.join()
+            if not self.online:
+                return "No Players Connected\n"
+            return ''.join(f"{i}. {name}, {steamId}\n" for i, (steamId, name) in enumerate(self.online.items()))
+
+    def chatlines(self, command):
+        # the first call gets the backlog, later calls the lines logged since the previous one
+        with self.lock:
+            count = self.backlog.pop(command, None)
+            if count is None:
+                count = self.chat
+            names = sorted(self.online.values()) or ['Nobody']
+            if count == 0:
+                return "Server received, But no response!! \n"
+            if command == 'getchat':
+                return ''.join(f"{name} ({name}): message {self.random.randrange(100000)}\n"
+                               for name in self.random.choices(names, k=count))
+            now = time.strftime('%Y.%m.%d_%H.%M.%S')
+            return ''.join(f"{now}: Tribe Bench, ID 1: Day 1, 10:00:00: <RichColor Color=\"1, 0, 0, 1\">{name} "
+                           f"tamed a Dodo {self.random.randrange(100000)}</>)\n"
+                           for name in self.random.choices(names, k=count))
+
+    def playercount(self):
+        with self.lock:
+            return len(self.online)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address[1]
+
+
+class FakeRconHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def packets(self, reqid, ptype, body):
+        chunks = [body[i:i + self.server.split] for i in range(0, len(body), self.server.split)] or [b'']
+        return b''.join(packet(reqid, ptype, chunk) for chunk in chunks)
+
+    def handle(self):
+        server = self.server
+        stream = self.request.makefile('rb')
+        if server.failure == 'down':
+            return
+        while True:
+            header = stream.read(4)
+            if len(header) < 4:
+                return
+            data = stream.read(struct.unpack('<l', header)[0])
+            reqid, ptype = struct.unpack('<ll', data[:8])
+            body = data[8:-2].decode('ascii', 'replace')
+            if server.failure == 'hang':
+                continue
+            if server.latency:
+                time.sleep(server.latency)
+            if ptype == SERVERDATA_AUTH:
+                if server.failure == 'badpass' or body != server.password:
+                    reply = packet(-1, SERVERDATA_AUTH_RESPONSE, b'')
+                else:
+                    reply = packet(reqid, SERVERDATA_RESPONSE_VALUE, b'') + packet(reqid, SERVERDATA_AUTH_RESPONSE, b'')
+            elif body == 'listplayers':
+                reply = self.packets(reqid, SERVERDATA_RESPONSE_VALUE, server.listplayers().encode())
+            elif body in ('getchat', 'getgamelog'):
+                reply = self.packets(reqid, SERVERDATA_RESPONSE_VALUE, server.chatlines(body).encode())
+            else:
+                reply = self.packets(reqid, SERVERDATA_RESPONSE_VALUE, b"Server received, But no response!! \n")
+            self.request.sendall(reply)
+
+
+def packet(reqid, ptype, body):
+    data = struct.pack('<ll', reqid, ptype) + body + b'\x00\x00'
+    return struct.pack('<l', len(data)) + data
+
+
+class FakeA2SServer(socketserver.ThreadingUDPServer):
+    """A2S_INFO responder reporting the player count of a FakeRconServer."""
+    daemon_threads = True
+
+    def __init__(self, rconServer, port=0):
+        socketserver.ThreadingUDPServer.__init__(self, ('127.0.0.1', port), FakeA2SHandler)
+        self.rconServer = rconServer
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address[1]
+
+
+class FakeA2SHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data, sock = self.request
+        if not data.startswith(b'\xFF\xFF\xFF\xFFTSource Engine Query\x00'):
+            return
+        reply = (b'\xFF\xFF\xFF\xFFI\x11' + b'Fake ARK\x00TheIsland\x00ark_survival_evolved\x00ARK\x00' +
+                 struct.pack('<hBBB', 0, min(255, self.server.rconServer.playercount()), 70, 0) + b'dl\x00\x01')
+        sock.sendto(reply, self.client_address)
+
+
+class FakeTelegramServer(http.server.ThreadingHTTPServer):
+    """Accepts POST /bot<token>/sendMessage. Every rateLimitEvery-th call is answered
+       with 429 and retry_after, to exercise the retry path."""
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, rateLimitEvery=0):
+        http.server.ThreadingHTTPServer.__init__(self, ('127.0.0.1', port), FakeTelegramHandler)
+        self.latency = latency
+        self.rateLimitEvery = rateLimitEvery
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.messages = []
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address[1]
+
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FakeTelegramHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes, don't let Nagle and delayed acks add 40ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        form = urllib.parse.parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.calls += 1
+            limited = server.rateLimitEvery and server.calls % server.rateLimitEvery == 0
+            if not limited:
+                server.messages.append({'chat_id': form.get('chat_id', [''])[0], 'text': form.get('text', [''])[0]})
+        if limited:
+            status, reply = 429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': 0}}
+        else:
+            status, reply = 200, {'ok': True, 'result': {}}
+        body = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run fake RCON, A2S and Telegram servers on 127.0.0.1")
+    parser.add_argument('--servers', type=int, default=1)
+    parser.add_argument('--players', type=int, default=10)
+    parser.add_argument('--churn', type=float, default=0.1)
+    parser.add_argument('--port', type=int, default=27020, help="first rcon port, query ports start at port+1000")
+    args = parser.parse_args()
+    for i in range(args.servers):
+        rcon = FakeRconServer(args.port + i, players=args.players, churn=args.churn, seed=i + 1)
+        rcon.start()
+        FakeA2SServer(rcon, args.port + 1000 + i).start()
+        print(f"[server:{i + 1}] rconPort: {args.port + i} queryPort: {args.port + 1000 + i} rconPass: {rcon.password}")
+    telegram = FakeTelegramServer(args.port + 2000)
+    telegram.start()
+    print(f"Telegram API: {telegram.url()}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Parses the replies of the ARK rcon commands getchat and getgamelog. Both return the
+# lines logged since the previous call, so after a server restart a reply can be large:
+# everything here works on a stream of reply packets and yields one line at a time.
+#   getchat:    "Bob (Bobby): hello"  or  "SERVER: restart in 5 minutes"
+#   getgamelog: "2026.10.17_20.15.03: Tribe Foo, ID 123: Day 5, 10:00:00: <RichColor Color="1, 0, 0, 1">Bob was killed!</>)"
+
+import datetime
+import re
+
+# getchat and getgamelog answer this when nothing was logged since the last call
+NO_RESPONSE = 'Server received, But no response!!'
+
+CHAT_LINE = re.compile(r"^(.+?) \((.+?)\): (.*)$")
+SERVER_LINE = re.compile(r"^(SERVER|ADMIN): (.*)$")
+LOG_TIME = re.compile(r"^(\d{4}\.\d{2}\.\d{2}_\d{2}\.\d{2}\.\d{2}): (.*)$")
+LOG_TRIBE = re.compile(r"^Tribe (.+?), ID \d+: (?:Day \d+, [\d:]+: )?(.*)$")
+RICH_COLOR = re.compile(r"</?RichColor[^>]*>|</>")
+
+def iterlines(packets, maxlength=2000):
+    """Yield (index, line) for every line in a stream of (index, bytes) reply packets,
+       as returned by srcds.SourceRcon.rconstream. A line cut between two packets is
+       joined, a line longer than maxlength bytes is cut off there, so only one packet
+       and one line are held in memory."""
+    index = None
+    partial = b''
+    for packetindex, data in packets:
+        if packetindex != index:
+            if partial:
+                yield index, decode(partial)
+            index = packetindex
+            partial = b''
+        lines = (partial + data).split(b'\n')
+        partial = lines.pop()[:maxlength]
+        for line in lines:
+            yield index, decode(line[:maxlength])
+    if partial:
+        yield index, decode(partial)
+
+def decode(line):
+    return line.decode('utf-8', 'replace').strip()
+
+def parsechat(line, received):
+    """Return a chat entry dict (time, kind, sender, message) for a getchat line, or
+       None for an empty line."""
+    if not line or line.startswith(NO_RESPONSE):
+        return None
+    result = CHAT_LINE.match(line)
+    if result is not None:
+        return {'time': received, 'kind': 'chat', 'sender': result.group(1), 'message': result.group(3)}
+    result = SERVER_LINE.match(line)
+    if result is not None:
+        return {'time': received, 'kind': 'chat', 'sender': result.group(1), 'message': result.group(2)}
+    return {'time': received, 'kind': 'chat', 'sender': None, 'message': line}
+
+def parselog(line, received):
+    """Return an entry dict for a getgamelog line, with the time the server logged it
+       when the line has one, or None for an empty line. Color tags are removed."""
+    if not line or line.startswith(NO_RESPONSE):
+        return None
+    line = RICH_COLOR.sub('', line).strip()
+    time = received
+    result = LOG_TIME.match(line)
+    if result is not None:
+        time = parselogtime(result.group(1)) or received
+        line = result.group(2)
+    sender = None
+    result = LOG_TRIBE.match(line)
+    if result is not None:
+        sender, line = result.group(1), result.group(2)
+    if line.endswith(')') and line.count(')') > line.count('('):
+        # tribe log lines end with a stray parenthesis
+        line = line[:-1]
+    return {'time': time, 'kind': 'log', 'sender': sender, 'message': line}
+
+def parselogtime(text):
+    # 2026.10.17_20.15.03, sliced instead of strptime, which is slow enough to matter on a backlog
+    try:
+        return datetime.datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]),
+                                 int(text[11:13]), int(text[14:16]), int(text[17:19]))
+    except ValueError:
+        return None
+
+def parse(lines, parsers, received):
+    """Yield the entries of a stream of (index, line), parsers[index] being parsechat or
+       parselog for the command at that index."""
+    for index, line in lines:
+        entry = parsers[index](line, received)
+        if entry is not None:
+            yield entry
@@ -0,0 +1,173 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Small in-process metrics registry: counters and latency histograms with labels,
+# exported as a Prometheus textfile (node_exporter textfile collector) or JSON.
+
+import json
+import os
+import threading
+import time
+
+# latency buckets in seconds, upper bounds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metrics(object):
+    """Example usage:
+
+       import metrics
+       registry = metrics.Metrics()
+       with registry.timer('rcon_seconds', server='Ark01', phase='exec'):
+           ...
+       registry.inc('polls_total', server='Ark01')
+       registry.writeprometheus('/var/lib/node_exporter/arkserver.prom')
+    """
+    def __init__(self, prefix='arkserver_', buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def key(self, name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        """Add value to a counter."""
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record one value (usually seconds) in a histogram."""
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def timer(self, name, **labels):
+        """Context manager that observes the time spent in its block."""
+        return Timer(self, name, labels)
+
+    def snapshot(self):
+        """Return all metrics as plain data, as written by writejson."""
+        with self.lock:
+            counters = [{'name': self.prefix + name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [{'name': self.prefix + name, 'labels': dict(labels),
+                           'buckets': dict(zip([str(bound) for bound in self.buckets], histogram['buckets'])),
+                           'sum': histogram['sum'], 'count': histogram['count']}
+                          for (name, labels), histogram in sorted(self.histograms.items())]
+        return {'generated': time.time(), 'counters': counters, 'histograms': histograms}
+
+    def export(self):
+        """Return a copy of the raw counters and histograms, picklable, to be added to
+           another registry with merge (e.g. sent from a worker process)."""
+        with self.lock:
+            histograms = {key: {'buckets': list(histogram['buckets']), 'sum': histogram['sum'],
+                                'count': histogram['count']}
+                          for key, histogram in self.histograms.items()}
+            return {'counters': dict(self.counters), 'histograms': histograms}
+
+    def merge(self, exported):
+        """Add counters and histograms returned by export of a registry with the same buckets."""
+        with self.lock:
+            for key, value in exported['counters'].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, other in exported['histograms'].items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'], other['buckets'])]
+                histogram['sum'] += other['sum']
+                histogram['count'] += other['count']
+
+    def writestate(self, path):
+        """Write the raw counters and histograms for readstate, so a short-lived process
+           (e.g. started by cron) can continue counting where the previous run stopped."""
+        exported = self.export()
+        state = {'buckets': list(self.buckets),
+                 'counters': [[name, labels, value] for (name, labels), value in exported['counters'].items()],
+                 'histograms': [[name, labels, histogram] for (name, labels), histogram in exported['histograms'].items()]}
+        writeatomic(path, json.dumps(state))
+
+    def readstate(self, path):
+        """Add the counters and histograms written by writestate. Returns False when there
+           is no usable state, e.g. the file is missing or was written with other buckets."""
+        try:
+            with open(path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(state, dict) or state.get('buckets') != list(self.buckets):
+            return False
+        key = lambda name, labels: (name, tuple(tuple(label) for label in labels))
+        self.merge({'counters': dict((key(name, labels), value) for name, labels, value in state['counters']),
+                    'histograms': dict((key(name, labels), histogram) for name, labels, histogram in state['histograms'])})
+        return True
+
+    def prometheus(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for counter in snapshot['counters']:
+            if counter['name'] not in typed:
+                lines.append('# TYPE %s counter' % (counter['name'],))
+                typed.add(counter['name'])
+            lines.append('%s%s %s' % (counter['name'], formatlabels(counter['labels']), counter['value']))
+        for histogram in snapshot['histograms']:
+            name = histogram['name']
+            if name not in typed:
+                lines.append('# TYPE %s histogram' % (name,))
+                typed.add(name)
+            for bound, count in histogram['buckets'].items():
+                lines.append('%s_bucket%s %d' % (name, formatlabels(histogram['labels'], le=bound), count))
+            lines.append('%s_bucket%s %d' % (name, formatlabels(histogram['labels'], le='+Inf'), histogram['count']))
+            lines.append('%s_sum%s %f' % (name, formatlabels(histogram['labels']), histogram['sum']))
+            lines.append('%s_count%s %d' % (name, formatlabels(histogram['labels']), histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+    def writeprometheus(self, path):
+        """Write the Prometheus textfile, atomically so a scrape never sees half a file."""
+        writeatomic(path, self.prometheus())
+
+    def writejson(self, path):
+        """Write the JSON snapshot, atomically."""
+        writeatomic(path, json.dumps(self.snapshot(), indent=1))
+
+class Timer(object):
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+def formatlabels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    escaped = ['%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for key, value in sorted(labels.items())]
+    return '{' + ','.join(escaped) + '}'
+
+def writeatomic(path, text):
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmpPath, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmpPath, path)
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Append-only traces of rcon listplayers replies, one JSON object per line:
+#   {"t": "2026-10-17T20:15:03.120000", "up": 1, "reply": "0. Name, 7656..."}
+# "reply" is left out when it is the same as the previous reply of the server,
+# "up": 0 marks a poll where the server could not be reached.
+
+import datetime
+import heapq
+import json
+import os
+import threading
+import srcds
+
+class Recorder(object):
+    """Example usage:
+
+       import rcontrace
+       recorder = rcontrace.Recorder('traces')
+       recorder.record('ark-01.trace', datetime.datetime.now(), True, reply)
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.lastreply = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, name, t, online, reply=None):
+        """Append one poll result to the trace file name in the trace directory."""
+        entry = {'t': t.isoformat(), 'up': 1 if online else 0}
+        with self.lock:
+            if name not in self.lastreply:
+                # a cron run is a new process, continue from the reply the previous run wrote
+                self.lastreply[name] = lastreply(os.path.join(self.directory, name))
+            if online and reply != self.lastreply.get(name):
+                entry['reply'] = reply
+                self.lastreply[name] = reply
+            line = json.dumps(entry, separators=(',', ':')) + '\n'
+            with open(os.path.join(self.directory, name), 'a') as f:
+                f.write(line)
+
+def lastreply(path, blocksize=65536):
+    """Return the last reply written to a trace file, None when there is none. The file
+       is read backwards from the end, so a long trace costs about one block."""
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return None
+    with f:
+        end = f.seek(0, os.SEEK_END)
+        partial = b''
+        while end > 0:
+            start = max(0, end - blocksize)
+            f.seek(start)
+            lines = (f.read(end - start) + partial).split(b'\n')
+            end = start
+            # the first line may continue in the block before
+            partial = lines.pop(0) if end > 0 else b''
+            for line in reversed(lines):
+                if b'"reply"' not in line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if 'reply' in entry:
+                    return entry['reply']
+    return None
+
+class ReplayClient(object):
+    """Stands in for srcds.SourceRcon while replaying: rcon() returns the reply set
+       for the current entry, or raises SourceRconError when the server was down."""
+    def __init__(self):
+        self.reply = None
+
+    def rcon(self, command):
+        if self.reply is None:
+            raise srcds.SourceRconError('Server was down in the trace')
+        return self.reply.encode('utf-8')
+
+    def disconnect(self):
+        pass
+
+def readtrace(path):
+    """Yield (t, online, reply) for each entry of a trace file, with left out
+       replies filled in from the previous entry. Reads the file line by line."""
+    reply = None
+    with open(path, 'r') as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                t = datetime.datetime.fromisoformat(entry['t'])
+            except (ValueError, KeyError) as error:
+                raise ValueError(f"{path}:{lineno}: invalid trace entry: {error}")
+            reply = entry.get('reply', reply)
+            online = entry.get('up', 1) == 1
+            yield t, online, reply if online else None
+
+def mergetraces(traces):
+    """Merge several traces into one stream ordered by time. traces maps a key
+       (e.g. the server) to a trace path, yields (t, key, online, reply)."""
+    streams = [tagged(i, key, path) for i, (key, path) in enumerate(traces.items())]
+    for t, _, key, online, reply in heapq.merge(*streams):
+        yield t, key, online, reply
+
+def tagged(i, key, path):
+    # the index breaks ties between traces without comparing the keys
+    for t, online, reply in readtrace(path):
+        yield t, i, key, online, reply
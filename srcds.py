@@ -28,10 +28,15 @@
 
 """http://developer.valvesoftware.com/wiki/Source_RCON_Protocol"""
 
+import contextlib
+import itertools
 import select
 import socket
 import struct
 
+# imported by AsyncSourceRcon, so the blocking client doesn't pay for loading asyncio
+asyncio = None
+
 SERVERDATA_AUTH = 3
 SERVERDATA_AUTH_RESPONSE = 2
 
@@ -58,101 +63,156 @@ class SourceRcon(object):
        import srcds
        server = srcds.SourceRcon('127.0.0.1', 27015, 'gerbouille')
        print(server.rcon('cvarlist'))
+
+       With sentinel=True every command is followed by an empty command, and the
+       reply is complete when the answer to that one comes back. This avoids
+       guessing whether a reply was split into more packets.
+
+       timer is an optional callable taking a phase name ('connect', 'auth' or
+       'exec') and returning a context manager that times that phase.
     """
-    def __init__(self, host, port=27015, password='', timeout=1.0):
+    def __init__(self, host, port=27015, password='', timeout=1.0, sentinel=False, timer=None):
         self.host = host
         self.port = port
         self.password = password
         self.timeout = timeout
+        self.sentinel = sentinel
+        self.timer = timer
         self.tcp = None
         self.reqid = 0
+        self.buf = bytearray(MAX_MESSAGE_LENGTH)
+        self.view = memoryview(self.buf)
 
     def disconnect(self):
         """Disconnect from the server."""
         if self.tcp:
             self.tcp.close()
 
+    def timed(self, phase):
+        """Time a phase with the timer given to the constructor. Should only be used internally."""
+        if self.timer is None:
+            return contextlib.nullcontext()
+        return self.timer(phase)
+
     def connect(self):
         """Connect to the server. Should only be used internally."""
-        try:
-            self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.tcp.settimeout(self.timeout)
-            self.tcp.setblocking(1)
-            self.tcp.connect((self.host, self.port))
-        except socket.error as msg:
-            raise SourceRconError('Disconnected from RCON, please restart program to continue.')
-
-    def send(self, cmd, message):
-        """Send command and message to the server. Should only be used internally."""
+        with self.timed('connect'):
+            try:
+                self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.tcp.settimeout(self.timeout)
+                self.tcp.setblocking(1)
+                # requests are small and often written back to back, don't let Nagle hold them
+                self.tcp.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.tcp.connect((self.host, self.port))
+            except socket.error as msg:
+                raise SourceRconError('Disconnected from RCON, please restart program to continue.')
+
+    def packet(self, cmd, message):
+        """Build the next request packet. Should only be used internally."""
         if len(message) > MAX_COMMAND_LENGTH:
             raise SourceRconError('RCON message too large to send')
 
         self.reqid += 1
         data = struct.pack('<l', self.reqid) + struct.pack('<l', cmd) + bytearray(message, 'ascii') + b'\x00\x00'
-        self.tcp.send(struct.pack('<l', len(data)) + data)
+        return struct.pack('<l', len(data)) + data
+
+    def send(self, cmd, message):
+        """Send command and message to the server. Should only be used internally."""
+        self.tcp.sendall(self.packet(cmd, message))
+
+    def recvinto(self, size):
+        """Fill the first size bytes of the packet buffer from the socket. Returns the
+           number of bytes read, which is short if the timeout expired. Should only be
+           used internally."""
+        got = 0
+        while got < size:
+            try:
+                recv = self.tcp.recv_into(self.view[got:size])
+                if not recv:
+                    raise SourceRconError('RCON connection unexpectedly closed by remote host')
+                got += recv
+            except SourceRconError:
+                raise
+            except:
+                break
+        return got
+
+    def readpacket(self):
+        """Read one packet from the server into self.buf. Returns (packetsize, requestid,
+           response) or None if nothing arrived before the timeout. The strings stay in
+           self.buf[8:packetsize] until the next read. Should only be used internally."""
+        # read the size of this packet
+        if self.recvinto(4) != 4:
+            # we waited for a packet but there isn't anything
+            return None
+
+        packetsize = struct.unpack_from('<l', self.buf)[0]
+
+        if packetsize < MIN_MESSAGE_LENGTH or packetsize > MAX_MESSAGE_LENGTH:
+            raise SourceRconError('RCON packet claims to have illegal size: %d bytes' % (packetsize,))
+
+        # read the whole packet
+        got = self.recvinto(packetsize)
+        if got != packetsize:
+            raise SourceRconError('Received RCON packet with bad length (%d of %d bytes)' % (got,packetsize,))
+
+        requestid, response = struct.unpack_from('<ll', self.buf)
+        return packetsize, requestid, response
+
+    def strings(self, packetsize):
+        """Return the two strings of the packet in self.buf. Should only be used internally."""
+        # find the two string terminators in place
+        pos1 = self.buf.find(b'\x00', 8, packetsize)
+        pos2 = self.buf.find(b'\x00', pos1+1, packetsize) if pos1 >= 0 else -1
+
+        if pos2 < 0:
+            raise SourceRconError('RCON response is missing string terminators')
 
-    def receive(self):
-        """Receive a reply from the server. Should only be used internally."""
+        elif pos2+1 != packetsize:
+            raise SourceRconError('RCON response contains %d superfluous bytes' % (packetsize-pos2-1,))
+
+        return self.view[8:pos1].tobytes(), self.view[pos1+1:pos2].tobytes()
+
+    def receive(self, sentinelid=None):
+        """Receive a reply from the server. Should only be used internally.
+
+           Without sentinelid the end of a split reply is guessed. With sentinelid,
+           packets are read until the reply to that (empty) request arrives, see
+           execute()."""
         packetsize = False
         requestid = False
         response = False
-        message = b''
-        message2 = b''
+        # packets are read into one preallocated buffer, each string is copied out
+        # once and the parts are joined at the end
+        message = []
+        message2 = []
 
         # response may be split into multiple packets, we don't know how many
         # so we loop until we decide to finish
         while 1:
-            # read the size of this packet
-            buf = b''
-
-            while len(buf) < 4:
-                try:
-                    recv = self.tcp.recv(4 - len(buf))
-                    if not len(recv):
-                        raise SourceRconError('RCON connection unexpectedly closed by remote host')
-                    buf += recv
-                except SourceRconError:
-                    raise
-                except:
-                    break
-
-            if len(buf) != 4:
-                # we waited for a packet but there isn't anything
-                break
-
-            packetsize = struct.unpack('<l', buf)[0]
+            packet = self.readpacket()
 
-            if packetsize < MIN_MESSAGE_LENGTH or packetsize > MAX_MESSAGE_LENGTH:
-                raise SourceRconError('RCON packet claims to have illegal size: %d bytes' % (packetsize,))
-
-            # read the whole packet
-            buf = b''
-
-            while len(buf) < packetsize:
-                try:
-                    recv = self.tcp.recv(packetsize - len(buf))
-                    if not len(recv):
-                        raise SourceRconError('RCON connection unexpectedly closed by remote host')
-                    buf += recv
-                except SourceRconError:
-                    raise
-                except:
-                    break
-
-            if len(buf) != packetsize:
-                raise SourceRconError('Received RCON packet with bad length (%d of %d bytes)' % (len(buf),packetsize,))
+            if packet is None:
+                if sentinelid is not None:
+                    raise SourceRconError('Timed out while waiting for end of reply')
+                break
 
-            # parse the packet
-            requestid = struct.unpack('<l', buf[:4])[0]
+            packetsize, requestid, response = packet
 
             if requestid == -1:
                 self.disconnect()
                 raise SourceRconError('Bad RCON password')
 
-            elif requestid != self.reqid:
-                raise SourceRconError('RCON request id error: %d, expected %d' % (requestid,self.reqid,))
+            elif sentinelid is not None and requestid == sentinelid:
+                # everything sent before the sentinel has been answered
+                break
 
-            response = struct.unpack('<l', buf[4:8])[0]
+            elif sentinelid is not None and requestid < sentinelid - 1:
+                # late packet for an earlier request that timed out, skip it
+                continue
+
+            elif requestid != (self.reqid if sentinelid is None else sentinelid - 1):
+                raise SourceRconError('RCON request id error: %d, expected %d' % (requestid,self.reqid if sentinelid is None else sentinelid - 1,))
 
             if response == SERVERDATA_AUTH_RESPONSE:
                 # This response says we're successfully authed.
@@ -161,19 +221,14 @@ class SourceRcon(object):
             elif response != SERVERDATA_RESPONSE_VALUE:
                 raise SourceRconError('Invalid RCON command response: %d' % (response,))
 
-            # extract the two strings using index magic
-            str1 = buf[8:]
-            pos1 = str1.index(b'\x00')
-            str2 = str1[pos1+1:]
-            pos2 = str2.index(b'\x00')
-            crap = str2[pos2+1:]
-
-            if crap:
-                raise SourceRconError('RCON response contains %d superfluous bytes' % (len(crap),))
-
             # add the strings to the full message result
-            message += str1[:pos1]
-            message2 += str2[:pos2]
+            str1, str2 = self.strings(packetsize)
+            message.append(str1)
+            if str2:
+                message2.append(str2)
+
+            if sentinelid is not None:
+                continue
 
             # unconditionally poll for more packets
             poll = select.select([self.tcp], [], [], 0)
@@ -182,13 +237,115 @@ class SourceRcon(object):
                 # no packets waiting, previous packet wasn't large: let's stop here.
                 break
 
-        if response is False:
+        if response is False and sentinelid is None:
             raise SourceRconError('Timed out while waiting for reply')
 
         elif message2:
-            raise SourceRconError('Invalid response message: %s' % (repr(message2),))
+            raise SourceRconError('Invalid response message: %s' % (repr(b''.join(message2)),))
+
+        return b''.join(message)
+
+    def execute(self, command):
+        """Send a single command on the current connection and return the reply.
+           Should only be used internally."""
+        with self.timed('exec'):
+            if not self.sentinel:
+                self.send(SERVERDATA_EXECCOMMAND, command)
+                return self.receive()
+            # the server answers requests in order, so once the reply to an empty command
+            # sent right behind this one arrives, the (possibly split) reply is complete
+            data = self.packet(SERVERDATA_EXECCOMMAND, command)
+            self.tcp.sendall(data + self.packet(SERVERDATA_EXECCOMMAND, ''))
+            return self.receive(self.reqid)
+
+    def receivebatch(self, firstid, sentinelid):
+        """Receive the replies to requests firstid up to the sentinel request and return
+           them by request id. Should only be used internally."""
+        messages = dict((reqid, []) for reqid in range(firstid, sentinelid))
+        for index, part in self.receivestream(firstid, sentinelid):
+            messages[firstid + index].append(part)
+
+        return dict((reqid, b''.join(parts)) for reqid, parts in messages.items())
+
+    def receivestream(self, firstid, sentinelid):
+        """Yield (index, bytes) for every non-empty packet of the replies to requests
+           firstid up to the sentinel request, index counting from 0 at firstid. Should
+           only be used internally."""
+        while 1:
+            packet = self.readpacket()
+
+            if packet is None:
+                raise SourceRconError('Timed out while waiting for end of reply')
+
+            packetsize, requestid, response = packet
+
+            if requestid == -1:
+                self.disconnect()
+                raise SourceRconError('Bad RCON password')
+
+            elif requestid == sentinelid:
+                break
+
+            elif requestid < firstid:
+                # late packet for an earlier request that timed out, skip it
+                continue
+
+            elif requestid > sentinelid:
+                raise SourceRconError('RCON request id error: %d, expected %d to %d' % (requestid,firstid,sentinelid,))
+
+            elif response != SERVERDATA_RESPONSE_VALUE:
+                raise SourceRconError('Invalid RCON command response: %d' % (response,))
+
+            str1, str2 = self.strings(packetsize)
+            if str2:
+                raise SourceRconError('Invalid response message: %s' % (repr(str2),))
+            if str1:
+                yield requestid - firstid, str1
+
+    def sendbatch(self, commands):
+        """Send all commands back to back, followed by a sentinel. Returns the request
+           ids of the first command and of the sentinel. Should only be used internally."""
+        firstid = self.reqid + 1
+        data = b''.join([self.packet(SERVERDATA_EXECCOMMAND, command) for command in commands])
+        data += self.packet(SERVERDATA_EXECCOMMAND, '')
+        self.tcp.sendall(data)
+        return firstid, self.reqid
+
+    def executebatch(self, commands):
+        """Send all commands back to back, followed by a sentinel, and return the replies
+           in order. Should only be used internally."""
+        with self.timed('exec'):
+            firstid, sentinelid = self.sendbatch(commands)
+            replies = self.receivebatch(firstid, sentinelid)
+            return [replies[reqid] for reqid in range(firstid, sentinelid)]
+
+    def executestream(self, commands):
+        """Send the commands like executebatch and return an iterator over the packets of
+           the replies, the first packet already received. Should only be used internally."""
+        with self.timed('exec'):
+            firstid, sentinelid = self.sendbatch(commands)
+            packets = self.receivestream(firstid, sentinelid)
+            first = next(packets, None)
+        if first is None:
+            return iter(())
+        return itertools.chain([first], packets)
+
+    def auth(self):
+        """(Re)connect and authenticate. Should only be used internally."""
+        self.disconnect()
+        self.connect()
+        with self.timed('auth'):
+            self.send(SERVERDATA_AUTH, self.password)
+
+            auth = self.receive()
+            # the first packet may be a "you have been banned" or empty string.
+            # in the latter case, fetch the second packet
+            if auth == b'':
+                auth = self.receive()
 
-        return message
+        if auth is not True:
+            self.disconnect()
+            raise SourceRconError('RCON authentication failure: %s' % (repr(auth),))
 
     def rcon(self, command):
         """Send RCON command to the server. Connect and auth if necessary,
@@ -197,29 +354,336 @@ class SourceRcon(object):
         if '\n' in command:
             commands = command.split('\n')
             def f(x): y = x.strip(); return len(y) and not y.startswith("//")
-            commands = filter(f, commands)
-            results = map(self.rcon, commands)
-            return "".join(results)
+            return b"".join(self.rconbatch(list(filter(f, commands))))
 
         # send a single command. connect and auth if necessary.
         try:
-            self.send(SERVERDATA_EXECCOMMAND, command)
-            return self.receive()
+            return self.execute(command)
         except:
             # timeout? invalid? we don't care. try one more time.
-            self.disconnect()
-            self.connect()
-            self.send(SERVERDATA_AUTH, self.password)
+            self.auth()
+            return self.execute(command)
+
+    def rconbatch(self, commands):
+        """Send several RCON commands at once and return the list of replies. The
+           commands are pipelined on one connection, so the batch costs about one
+           round trip instead of one per command."""
+        for command in commands:
+            if len(command) > MAX_COMMAND_LENGTH:
+                raise SourceRconError('RCON message too large to send')
+        if not commands:
+            return []
 
-            auth = self.receive()
-            # the first packet may be a "you have been banned" or empty string.
-            # in the latter case, fetch the second packet
-            if auth == b'':
-                auth = self.receive()
+        try:
+            return self.executebatch(commands)
+        except:
+            # timeout? invalid? we don't care. try one more time.
+            self.auth()
+            return self.executebatch(commands)
+
+    def rconstream(self, commands):
+        """Like rconbatch, but return an iterator of (index, bytes) over the reply packets
+           as they arrive instead of joined replies, index being the position of the
+           command. Only one packet is held in memory at a time, and a packet may end in
+           the middle of a line. The commands are only sent again after a reconnect when
+           nothing was received yet, a failure later on raises from the iterator."""
+        for command in commands:
+            if len(command) > MAX_COMMAND_LENGTH:
+                raise SourceRconError('RCON message too large to send')
+        if not commands:
+            return iter(())
 
-            if auth is not True:
-                self.disconnect()
-                raise SourceRconError('RCON authentication failure: %s' % (repr(auth),))
+        try:
+            return self.executestream(commands)
+        except:
+            # timeout? invalid? we don't care. try one more time.
+            self.auth()
+            return self.executestream(commands)
+
+
+class AsyncSourceRcon(object):
+    """asyncio version of SourceRcon, one event loop can drive many sessions.
+
+       Example usage:
+
+       import asyncio, srcds
+       async def main():
+           server = srcds.AsyncSourceRcon('127.0.0.1', 27015, 'gerbouille')
+           print(await server.rcon('cvarlist'))
+           await server.disconnect()
+       asyncio.run(main())
+    """
+    def __init__(self, host, port=27015, password='', timeout=1.0, splitwait=0.05, sentinel=False):
+        global asyncio
+        if asyncio is None:
+            import asyncio
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.splitwait = splitwait
+        self.sentinel = sentinel
+        self.reader = None
+        self.writer = None
+        self.reqid = 0
+        self.lock = None
+
+    async def disconnect(self):
+        """Disconnect from the server."""
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (OSError, asyncio.CancelledError):
+                pass
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        """Connect to the server. Should only be used internally."""
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError) as msg:
+            raise SourceRconError('Disconnected from RCON, please restart program to continue.')
+
+    def packet(self, cmd, message):
+        """Build the next request packet. Should only be used internally."""
+        if len(message) > MAX_COMMAND_LENGTH:
+            raise SourceRconError('RCON message too large to send')
+
+        self.reqid += 1
+        data = struct.pack('<l', self.reqid) + struct.pack('<l', cmd) + bytearray(message, 'ascii') + b'\x00\x00'
+        return struct.pack('<l', len(data)) + data
+
+    async def send(self, cmd, message):
+        """Send command and message to the server. Should only be used internally."""
+        if self.writer is None:
+            raise SourceRconError('Not connected to RCON')
+
+        self.writer.write(self.packet(cmd, message))
+        await self.writer.drain()
+
+    async def readpacket(self, timeout):
+        """Read and frame one packet from the stream. Returns (packetsize, requestid,
+           response, str1, str2) or None if nothing arrived within the timeout."""
+        try:
+            buf = await asyncio.wait_for(self.reader.readexactly(4), timeout)
+        except asyncio.TimeoutError:
+            return None
+        except asyncio.IncompleteReadError:
+            raise SourceRconError('RCON connection unexpectedly closed by remote host')
+
+        packetsize = struct.unpack('<l', buf)[0]
+
+        if packetsize < MIN_MESSAGE_LENGTH or packetsize > MAX_MESSAGE_LENGTH:
+            raise SourceRconError('RCON packet claims to have illegal size: %d bytes' % (packetsize,))
+
+        try:
+            buf = await asyncio.wait_for(self.reader.readexactly(packetsize), timeout)
+        except asyncio.TimeoutError:
+            raise SourceRconError('Received RCON packet with bad length (timed out after header of %d bytes)' % (packetsize,))
+        except asyncio.IncompleteReadError as error:
+            raise SourceRconError('Received RCON packet with bad length (%d of %d bytes)' % (len(error.partial),packetsize,))
+
+        requestid, response = struct.unpack('<ll', buf[:8])
+
+        pos1 = buf.find(b'\x00', 8)
+        pos2 = buf.find(b'\x00', pos1+1) if pos1 >= 0 else -1
+        if pos2 < 0:
+            raise SourceRconError('RCON response is missing string terminators')
+        if pos2+1 != packetsize:
+            raise SourceRconError('RCON response contains %d superfluous bytes' % (packetsize-pos2-1,))
+
+        return packetsize, requestid, response, buf[8:pos1], buf[pos1+1:pos2]
+
+    async def receive(self, sentinelid=None):
+        """Receive a reply from the server. Should only be used internally.
+           See SourceRcon.receive for sentinelid."""
+        response = False
+        message = []
+        message2 = []
+
+        # there is no zero timeout poll on a stream: after the first packet only wait
+        # splitwait for a continuation, unless the last packet was large enough to
+        # probably be split, then wait the full timeout like the blocking client does
+        wait = self.timeout
+        expected = self.reqid if sentinelid is None else sentinelid - 1
+        while 1:
+            packet = await self.readpacket(wait)
+            if packet is None:
+                if sentinelid is not None:
+                    raise SourceRconError('Timed out while waiting for end of reply')
+                break
+
+            packetsize, requestid, response, str1, str2 = packet
+
+            if requestid == -1:
+                await self.disconnect()
+                raise SourceRconError('Bad RCON password')
+
+            elif sentinelid is not None and requestid == sentinelid:
+                # everything sent before the sentinel has been answered
+                break
+
+            elif sentinelid is not None and requestid < expected:
+                # late packet for an earlier request that timed out, skip it
+                continue
+
+            elif requestid != expected:
+                raise SourceRconError('RCON request id error: %d, expected %d' % (requestid,expected,))
+
+            if response == SERVERDATA_AUTH_RESPONSE:
+                # This response says we're successfully authed.
+                return True
+
+            elif response != SERVERDATA_RESPONSE_VALUE:
+                raise SourceRconError('Invalid RCON command response: %d' % (response,))
+
+            message.append(str1)
+            message2.append(str2)
+
+            if sentinelid is None and packetsize < PROBABLY_SPLIT_IF_LARGER_THAN:
+                wait = self.splitwait
+            else:
+                wait = self.timeout
+
+        if response is False and sentinelid is None:
+            raise SourceRconError('Timed out while waiting for reply')
+
+        elif any(message2):
+            raise SourceRconError('Invalid response message: %s' % (repr(b''.join(message2)),))
+
+        return b''.join(message)
+
+    async def auth(self):
+        """Connect and authenticate. Should only be used internally."""
+        await self.disconnect()
+        await self.connect()
+        await self.send(SERVERDATA_AUTH, self.password)
+
+        auth = await self.receive()
+        # the first packet may be a "you have been banned" or empty string.
+        # in the latter case, fetch the second packet
+        if auth == b'':
+            auth = await self.receive()
+
+        if auth is not True:
+            await self.disconnect()
+            raise SourceRconError('RCON authentication failure: %s' % (repr(auth),))
+
+    async def rcon(self, command, timeout=None):
+        """Send RCON command to the server. Connect and auth if necessary,
+           handle dropped connections, send command and return reply.
+           timeout limits the whole request including a reconnect."""
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            try:
+                return await asyncio.wait_for(self._rcon(command), timeout)
+            except asyncio.TimeoutError:
+                await self.disconnect()
+                raise SourceRconError('Timed out while waiting for reply')
+
+    async def _rcon(self, command):
+        # special treatment for sending whole scripts
+        if '\n' in command:
+            commands = command.split('\n')
+            def f(x): y = x.strip(); return len(y) and not y.startswith("//")
+            return b"".join(await self._rconbatch(list(filter(f, commands))))
+
+        # send a single command. connect and auth if necessary.
+        try:
+            return await self.execute(command)
+        except (SourceRconError, OSError):
+            # timeout? invalid? we don't care. try one more time.
+            await self.auth()
+            return await self.execute(command)
+
+    async def execute(self, command):
+        """Send a single command on the current connection and return the reply.
+           Should only be used internally."""
+        if not self.sentinel:
+            await self.send(SERVERDATA_EXECCOMMAND, command)
+            return await self.receive()
+        if self.writer is None:
+            raise SourceRconError('Not connected to RCON')
+        data = self.packet(SERVERDATA_EXECCOMMAND, command)
+        self.writer.write(data + self.packet(SERVERDATA_EXECCOMMAND, ''))
+        await self.writer.drain()
+        return await self.receive(self.reqid)
+
+    async def rconbatch(self, commands, timeout=None):
+        """Send several RCON commands at once and return the list of replies, see
+           SourceRcon.rconbatch. timeout limits the whole batch."""
+        for command in commands:
+            if len(command) > MAX_COMMAND_LENGTH:
+                raise SourceRconError('RCON message too large to send')
+        if not commands:
+            return []
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            try:
+                return await asyncio.wait_for(self._rconbatch(commands), timeout)
+            except asyncio.TimeoutError:
+                await self.disconnect()
+                raise SourceRconError('Timed out while waiting for reply')
+
+    async def _rconbatch(self, commands):
+        try:
+            return await self.executebatch(commands)
+        except (SourceRconError, OSError):
+            # timeout? invalid? we don't care. try one more time.
+            await self.auth()
+            return await self.executebatch(commands)
+
+    async def receivebatch(self, firstid, sentinelid):
+        """Receive the replies to requests firstid up to the sentinel request and return
+           them by request id. Should only be used internally."""
+        messages = dict((reqid, []) for reqid in range(firstid, sentinelid))
+
+        while 1:
+            packet = await self.readpacket(self.timeout)
+
+            if packet is None:
+                raise SourceRconError('Timed out while waiting for end of reply')
+
+            packetsize, requestid, response, str1, str2 = packet
+
+            if requestid == -1:
+                await self.disconnect()
+                raise SourceRconError('Bad RCON password')
+
+            elif requestid == sentinelid:
+                break
+
+            elif requestid < firstid:
+                # late packet for an earlier request that timed out, skip it
+                continue
+
+            elif requestid not in messages:
+                raise SourceRconError('RCON request id error: %d, expected %d to %d' % (requestid,firstid,sentinelid,))
+
+            elif response != SERVERDATA_RESPONSE_VALUE:
+                raise SourceRconError('Invalid RCON command response: %d' % (response,))
 
-            self.send(SERVERDATA_EXECCOMMAND, command)
-            return self.receive()
\ No newline at end of file
+            if str2:
+                raise SourceRconError('Invalid response message: %s' % (repr(str2),))
+            messages[requestid].append(str1)
+
+        return dict((reqid, b''.join(parts)) for reqid, parts in messages.items())
+
+    async def executebatch(self, commands):
+        """Send all commands back to back, followed by a sentinel, and return the replies
+           in order. Should only be used internally."""
+        if self.writer is None:
+            raise SourceRconError('Not connected to RCON')
+
+        firstid = self.reqid + 1
+        data = b''.join([self.packet(SERVERDATA_EXECCOMMAND, command) for command in commands])
+        data += self.packet(SERVERDATA_EXECCOMMAND, '')
+        self.writer.write(data)
+        await self.writer.drain()
+        replies = await self.receivebatch(firstid, self.reqid)
+        return [replies[reqid] for reqid in range(firstid, self.reqid)]
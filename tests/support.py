@@ -0,0 +1,74 @@
+#
+# Shared by the tests: puts the repository and the benchmark fakes on the path, loads
+# arkserver-notify.py as a module and sets it up against temporary databases.
+#
+# Run from the repository root: python -m pytest -q tests
+
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+testsDir = os.path.dirname(os.path.abspath(__file__))
+repoDir = os.path.dirname(testsDir)
+sys.path.insert(0, repoDir)
+sys.path.insert(0, os.path.join(repoDir, 'benchmarks'))
+
+from bench_poll import loadNotifier
+
+
+class NotifierTestCase(unittest.TestCase):
+    """Loads a fresh notifier per test, with Telegram replaced by a list of sent messages, its
+       clock set to self.now and one empty database per server in a temporary directory."""
+    serverCount = 2
+
+    def setUp(self):
+        self.notifier = loadNotifier()
+        self.notifier.printInfoToScreen = False
+        self.notifier.printTelegram = False
+        self.now = datetime.datetime(2026, 10, 17, 20, 0)
+        self.notifier.clock = lambda: self.now
+        self.sent = []
+        self.notifier.sendTelegramMsg = self.sendTelegramMsg
+        self.dbDir = tempfile.mkdtemp()
+        self.cons = []
+        for i in range(1, self.serverCount + 1):
+            server = self.serverConfig(i)
+            con = self.notifier.connectDB(os.path.join(self.dbDir, server['dbname']))
+            self.notifier.createTable(con, server['id'])
+            self.cons.append((server, con))
+
+    def tearDown(self):
+        for server, con in self.cons:
+            con.close()
+        if self.notifier.outboxExecutor is not None:
+            self.notifier.outboxExecutor.shutdown()
+        shutil.rmtree(self.dbDir)
+
+    def serverConfig(self, i, **values):
+        # a server as parseConfig returns it
+        server = {'id': str(i), 'name': f"Ark0{i}", 'dbname': "ark-%02d.db" % i, 'rconip': '127.0.0.1',
+                  'rconport': 0, 'rconpass': '', 'queryport': None, 'telegrambottoken': 'token',
+                  'telegrambotchatid': 'chat', 'ingestchat': False, 'chatalertkeywords': []}
+        server.update(values)
+        return server
+
+    def sendTelegramMsg(self, token, chatId, sendText):
+        self.sent.append(sendText)
+        return 'sent', None
+
+    def poll(self, serverIndex, players):
+        # one poll cycle of a server that reports the given {steamId: name}
+        server, con = self.cons[serverIndex]
+        self.notifier.insertUpdatePlayersDB(con, server, players)
+        con.commit()
+
+    def advance(self, seconds):
+        self.now += datetime.timedelta(seconds=seconds)
+
+    def counter(self, name, **labels):
+        # summed over the labels not given, e.g. server
+        return sum(value for (counterName, counterLabels), value in self.notifier.registry.counters.items()
+                   if counterName == name and set(labels.items()) <= set(counterLabels))
@@ -0,0 +1,94 @@
+import struct
+import unittest
+
+import support
+import a2s
+import fakeservers
+
+
+def reply(name=b'Fake ARK', players=3):
+    return (b'\xFF\xFF\xFF\xFFI\x11' + name + b'\x00TheIsland\x00ark_survival_evolved\x00ARK\x00'
+            + struct.pack('<hBBB', 0, players, 70, 0) + b'dl\x00\x01')
+
+
+class ParseInfoTest(unittest.TestCase):
+    def test_parseinfo(self):
+        self.assertEqual(a2s.parseinfo(reply()),
+                         {'name': 'Fake ARK', 'map': 'TheIsland', 'folder': 'ark_survival_evolved', 'game': 'ARK',
+                          'appid': 0, 'players': 3, 'maxplayers': 70, 'bots': 0})
+
+    def test_bad_header(self):
+        self.assertRaises(a2s.A2SError, a2s.parseinfo, b'\xFE\xFF\xFF\xFFI\x11')
+        self.assertRaises(a2s.A2SError, a2s.parseinfo, b'\xFF\xFF\xFF\xFFA\x11')
+
+    def test_truncated(self):
+        data = reply()
+        self.assertRaises(a2s.A2SError, a2s.parseinfo, data[:12])
+        self.assertRaises(a2s.A2SError, a2s.parseinfo, data[:data.index(b'ARK\x00') + 6])
+
+
+class QueryInfoTest(unittest.TestCase):
+    def test_queryinfo_against_fake(self):
+        rcon = fakeservers.FakeRconServer(players=7)
+        query = fakeservers.FakeA2SServer(rcon)
+        port = query.start()
+        try:
+            self.assertEqual(a2s.queryinfo('127.0.0.1', port, timeout=2.0)['players'], 7)
+        finally:
+            query.shutdown()
+            query.server_close()
+            rcon.server_close()
+
+
+class ProbeTest(support.NotifierTestCase):
+    serverCount = 0
+
+    def setUp(self):
+        support.NotifierTestCase.setUp(self)
+        self.rcon = fakeservers.FakeRconServer(players=0)
+        self.query = fakeservers.FakeA2SServer(self.rcon)
+        server = self.serverConfig(1, rconport=self.rcon.start(), rconpass=self.rcon.password,
+                                   queryport=self.query.start())
+        self.session = self.notifier.openSession(self.dbDir, server)
+        self.cons.append((server, self.session['con']))
+
+    def tearDown(self):
+        self.session['rcon'].disconnect()
+        for fake in (self.query, self.rcon):
+            fake.shutdown()
+            fake.server_close()
+        support.NotifierTestCase.tearDown(self)
+
+    def test_matching_count_skips_rcon(self):
+        self.notifier.pollSession(self.session)
+        requests = self.rcon.requests
+        self.advance(60)
+        self.notifier.pollSession(self.session)
+        self.assertTrue(self.session['online'])
+        self.assertEqual(self.rcon.requests, requests)
+        self.assertEqual(self.counter('a2s_probes_total', result='rcon_skipped'), 1)
+
+    def test_offline_server_stays_offline_when_count_matches(self):
+        self.notifier.pollSession(self.session)
+        # a player joins while rcon goes down: the count changed, rcon is asked and fails
+        self.rcon.join()
+        self.rcon.failure = 'badpass'
+        self.session['rcon'].disconnect()
+        self.advance(60)
+        self.notifier.pollSession(self.session)
+        self.assertFalse(self.session['online'])
+        # A2S now matches the empty roster again and the last sync is recent, still only rcon may
+        # bring the server back
+        self.rcon.online.clear()
+        self.advance(60)
+        self.notifier.pollSession(self.session)
+        self.assertFalse(self.session['online'])
+        self.assertEqual(self.counter('a2s_probes_total', result='rcon_skipped'), 0)
+        server, con = self.cons[0]
+        self.assertEqual(self.notifier.getSyncStatus(con, server)['server_online'], 0)
+        self.notifier.drainOutbox(self.cons)
+        self.assertFalse([text for text in self.sent if 'back online' in text])
+
+
+if __name__ == '__main__':
+    unittest.main()
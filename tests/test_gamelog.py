@@ -0,0 +1,107 @@
+import datetime
+import sqlite3
+import unittest
+
+import support
+import fakeservers
+import gamelog
+
+RECEIVED = datetime.datetime(2026, 10, 17, 20, 30)
+
+
+class IterLinesTest(unittest.TestCase):
+    def test_line_split_between_packets(self):
+        packets = [(0, b'Bob (Bobby): hel'), (0, b'lo\nAlice (Al'), (0, b'i): hi\n')]
+        self.assertEqual(list(gamelog.iterlines(packets)),
+                         [(0, 'Bob (Bobby): hello'), (0, 'Alice (Ali): hi')])
+
+    def test_character_split_between_packets(self):
+        data = 'Bob (Bobby): grüße\n'.encode()
+        cut = data.index('ü'.encode()) + 1
+        packets = [(0, data[:cut]), (0, data[cut:])]
+        self.assertEqual(list(gamelog.iterlines(packets)), [(0, 'Bob (Bobby): grüße')])
+
+    def test_last_line_of_a_command_without_newline(self):
+        packets = [(0, b'first\nsecond'), (1, b'third\n')]
+        self.assertEqual(list(gamelog.iterlines(packets)), [(0, 'first'), (0, 'second'), (1, 'third')])
+
+    def test_long_line_is_cut_off(self):
+        packets = [(0, b'x' * 6), (0, b'x' * 6), (0, b'x\nshort\n')]
+        self.assertEqual(list(gamelog.iterlines(packets, maxlength=8)), [(0, 'x' * 8), (0, 'short')])
+
+
+class ParseTest(unittest.TestCase):
+    def test_parsechat(self):
+        self.assertEqual(gamelog.parsechat('Bob (Bobby): hello (again)', RECEIVED),
+                         {'time': RECEIVED, 'kind': 'chat', 'sender': 'Bob', 'message': 'hello (again)'})
+        self.assertEqual(gamelog.parsechat('SERVER: restart in 5 minutes', RECEIVED)['sender'], 'SERVER')
+        self.assertIsNone(gamelog.parsechat('Server received, But no response!!', RECEIVED))
+        self.assertIsNone(gamelog.parsechat('', RECEIVED))
+
+    def test_parselog(self):
+        line = ('2026.10.17_20.15.03: Tribe Foo, ID 123: Day 5, 10:00:00: '
+                '<RichColor Color="1, 0, 0, 1">Bob was killed!</>)')
+        self.assertEqual(gamelog.parselog(line, RECEIVED),
+                         {'time': datetime.datetime(2026, 10, 17, 20, 15, 3), 'kind': 'log',
+                          'sender': 'Foo', 'message': 'Bob was killed!'})
+
+    def test_parselog_bad_time(self):
+        entry = gamelog.parselog('2026.13.45_20.15.03: something happened', RECEIVED)
+        self.assertEqual(entry['time'], RECEIVED)
+        self.assertEqual(entry['message'], 'something happened')
+
+    def test_parse_uses_parser_per_command(self):
+        lines = [(0, 'Bob (Bobby): hi'), (1, 'Tribe Foo, ID 1: tamed a Dodo'), (0, '')]
+        entries = list(gamelog.parse(lines, [gamelog.parsechat, gamelog.parselog], RECEIVED))
+        self.assertEqual([entry['kind'] for entry in entries], ['chat', 'log'])
+        self.assertEqual(entries[1]['sender'], 'Foo')
+
+
+class IngestChatTest(support.NotifierTestCase):
+    serverCount = 0
+
+    def setUp(self):
+        support.NotifierTestCase.setUp(self)
+        self.notifier.chatBatchRows = 4
+        self.rcon = fakeservers.FakeRconServer(players=3, split=64, backlog=10)
+        server = self.serverConfig(1, rconport=self.rcon.start(), rconpass=self.rcon.password, ingestchat=True,
+                                   chatalertkeywords=['message'])
+        self.session = self.notifier.openSession(self.dbDir, server)
+        self.cons.append((server, self.session['con']))
+
+    def tearDown(self):
+        self.session['rcon'].disconnect()
+        self.rcon.shutdown()
+        self.rcon.server_close()
+        support.NotifierTestCase.tearDown(self)
+
+    def test_write_lock_is_free_while_reading_chat(self):
+        # another writer, like the outbox sender, must get the lock whenever a packet is read
+        other = sqlite3.connect(f"{self.dbDir}/{self.session['server']['dbname']}", timeout=0)
+        locked = []
+        rconstream = self.session['rcon'].rconstream
+
+        def stream(commands):
+            for packet in rconstream(commands):
+                try:
+                    other.execute("BEGIN IMMEDIATE;")
+                    other.execute("ROLLBACK;")
+                except sqlite3.OperationalError as error:
+                    locked.append(str(error))
+                yield packet
+        self.session['rcon'].rconstream = stream
+        try:
+            self.notifier.pollSession(self.session)
+        finally:
+            other.close()
+        self.assertEqual(locked, [])
+        con = self.session['con']
+        self.assertEqual(con.execute(f"SELECT COUNT(*) FROM \"{self.notifier.chatTable}\";").fetchone()[0], 20)
+        # the presence cycle, 5 batches of 4 lines and the alert message
+        self.assertEqual(self.session['commits'], 7)
+        self.assertEqual(con.execute(f"SELECT kind FROM \"{self.notifier.outboxTable}\" WHERE payload LIKE '%chat alert%';")
+                         .fetchone()[0], 'text')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import support
+import metrics
+
+
+class StateTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'metrics.prom.state')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_roundtrip(self):
+        registry = metrics.Metrics()
+        registry.inc('polls_total', 3, server='Ark01', result='online')
+        registry.observe('poll_seconds', 0.02, server='Ark01')
+        registry.writestate(self.path)
+        total = metrics.Metrics()
+        total.inc('polls_total', 1, server='Ark01', result='online')
+        self.assertTrue(total.readstate(self.path))
+        self.assertEqual(total.counters[total.key('polls_total', {'server': 'Ark01', 'result': 'online'})], 4)
+        histogram = total.histograms[total.key('poll_seconds', {'server': 'Ark01'})]
+        self.assertEqual(histogram['count'], 1)
+        self.assertEqual(histogram['buckets'], registry.histograms[registry.key('poll_seconds', {'server': 'Ark01'})]['buckets'])
+
+    def test_unusable_state(self):
+        registry = metrics.Metrics()
+        self.assertFalse(registry.readstate(self.path))
+        metrics.Metrics(buckets=(1.0, 2.0)).writestate(self.path)
+        self.assertFalse(registry.readstate(self.path))
+        with open(self.path, 'w') as f:
+            f.write('{"buckets": ')
+        self.assertFalse(registry.readstate(self.path))
+        self.assertEqual(registry.counters, {})
+
+
+class CronMetricsTest(support.NotifierTestCase):
+    serverCount = 0
+
+    def setUp(self):
+        support.NotifierTestCase.setUp(self)
+        self.notifier.metricsPromFile = os.path.join(self.dbDir, 'arkserver.prom')
+
+    def run_cron(self):
+        # a cron run starts with an empty registry
+        self.notifier.registry = metrics.Metrics()
+        self.notifier.registry.inc('polls_total', server='Ark01', result='online')
+        self.notifier.writeCronMetrics()
+
+    def exported(self):
+        with open(self.notifier.metricsPromFile) as f:
+            return [line for line in f.read().splitlines() if line.startswith('arkserver_polls_total')]
+
+    def test_counters_add_up_over_runs(self):
+        for i in range(3):
+            self.run_cron()
+        self.assertEqual(self.exported(), ['arkserver_polls_total{result="online",server="Ark01"} 3'])
+
+    def test_overlapping_runs_wait_for_the_lock(self):
+        self.run_cron()
+        with open(self.notifier.metricsPromFile + '.state.lock', 'w') as lockFile:
+            fcntl.flock(lockFile, fcntl.LOCK_EX)
+            other = threading.Thread(target=self.run_cron)
+            other.start()
+            time.sleep(0.2)
+            self.assertTrue(other.is_alive())
+        other.join(5)
+        self.assertFalse(other.is_alive())
+        self.assertEqual(self.exported(), ['arkserver_polls_total{result="online",server="Ark01"} 2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
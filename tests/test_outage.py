@@ -0,0 +1,85 @@
+import unittest
+
+import support
+import fakeservers
+
+
+class OutageTest(support.NotifierTestCase):
+    serverCount = 0
+
+    def setUp(self):
+        support.NotifierTestCase.setUp(self)
+        self.rcon = fakeservers.FakeRconServer(players=5)
+        server = self.serverConfig(1, rconport=self.rcon.start(), rconpass=self.rcon.password)
+        self.session = self.notifier.openSession(self.dbDir, server)
+        self.cons.append((server, self.session['con']))
+        self.notifier.knownServers = {1: server}
+
+    def tearDown(self):
+        self.session['rcon'].disconnect()
+        self.rcon.shutdown()
+        self.rcon.server_close()
+        self.notifier.closeIndexDb()
+        support.NotifierTestCase.tearDown(self)
+
+    def poll(self, seconds):
+        self.advance(seconds)
+        self.notifier.pollSession(self.session)
+        self.notifier.updatePlayerIndex(self.dbDir)
+        self.notifier.drainOutbox(self.cons)
+
+    def goDown(self):
+        self.rcon.failure = 'down'
+        self.session['rcon'].disconnect()
+
+    def query(self, sql):
+        return [tuple(row) for row in self.session['con'].execute(sql).fetchall()]
+
+    def test_down_and_back(self):
+        self.poll(0)
+        self.sent.clear()
+        self.goDown()
+        self.poll(600)
+        # one summary message instead of a leave per player
+        self.assertEqual(len(self.sent), 1)
+        self.assertIn('seems to be offline', self.sent[0])
+        self.assertIn('5 player(s) were online', self.sent[0])
+        self.assertEqual(self.notifier.loadOnlineRoster(self.session['con']), {})
+        self.assertEqual(self.query(f"SELECT COUNT(*) FROM \"{self.notifier.sessionTable}\" WHERE ended IS NULL;"), [(0,)])
+        self.assertEqual(self.query(f"SELECT started, ended, players FROM \"{self.notifier.outageTable}\";"),
+                         [(self.now, None, 5)])
+        self.assertEqual(self.query(f"SELECT COUNT(*), SUM(seconds) FROM \"{self.notifier.playerDayRollupTable}\";"),
+                         [(5, 5 * 600.0)])
+        self.assertEqual(self.query(f"SELECT unique_players FROM \"{self.notifier.dailyRollupTable}\";"), [(5,)])
+        index = self.notifier.getIndexDb(self.dbDir)
+        self.assertEqual(index.execute(f"SELECT COUNT(*) FROM \"{self.notifier.indexTable}\" WHERE online_now = 1;")
+                         .fetchone()[0], 0)
+        self.assertEqual(index.execute(f"SELECT SUM(sessions), SUM(seconds) FROM \"{self.notifier.indexTotalsTable}\";")
+                         .fetchone()[:], (5, 5 * 600.0))
+
+        # still down: no new outage and no new message within notifyOfflineIntervalH
+        self.poll(600)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(self.query(f"SELECT COUNT(*) FROM \"{self.notifier.outageTable}\";"), [(1,)])
+
+        self.rcon.failure = None
+        outageStart = self.query(f"SELECT started FROM \"{self.notifier.outageTable}\";")[0][0]
+        self.poll(600)
+        self.assertIn('is back online after being offline for 0u20m', self.sent[1])
+        self.assertEqual(self.query(f"SELECT ended, duration_s FROM \"{self.notifier.outageTable}\";"),
+                         [(self.now, (self.now - outageStart).total_seconds())])
+        self.assertEqual(len(self.notifier.loadOnlineRoster(self.session['con'])), 5)
+        self.assertEqual(self.query(f"SELECT COUNT(*) FROM \"{self.notifier.sessionTable}\" WHERE ended IS NULL;"), [(5,)])
+        self.assertEqual(index.execute(f"SELECT COUNT(*) FROM \"{self.notifier.indexTable}\" WHERE online_now = 1;")
+                         .fetchone()[0], 5)
+
+    def test_still_offline_reminder(self):
+        self.goDown()
+        self.poll(0)
+        self.poll(self.notifier.notifyOfflineIntervalH * 3600 + 60)
+        self.assertEqual(len(self.sent), 2)
+        self.assertIn('is still offline, since 20:00 (1u1m)', self.sent[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+import support
+
+ALICE = 76561190000000001
+BOB = 76561190000000002
+
+
+class MergeTransfersTest(support.NotifierTestCase):
+    def outboxRows(self):
+        return sum(con.execute(f"SELECT COUNT(*) FROM \"{self.notifier.outboxTable}\";").fetchone()[0]
+                   for server, con in self.cons)
+
+    def drain(self):
+        sent, nextDue = self.notifier.drainOutbox(self.cons)
+        return sent
+
+    def test_join_is_sent_right_away(self):
+        self.poll(0, {ALICE: 'Alice'})
+        self.assertEqual(self.drain(), 1)
+        self.assertIn('Alice', self.sent[0])
+        self.assertEqual(self.outboxRows(), 0)
+
+    def test_transfer_between_servers(self):
+        self.poll(0, {ALICE: 'Alice'})
+        self.drain()
+        self.advance(60)
+        self.poll(0, {})
+        self.poll(1, {ALICE: 'Alice'})
+        self.assertEqual(self.drain(), 1)
+        self.assertIn('Ark player Alice moved from Ark01 to Ark02.', self.sent[-1])
+        self.assertNotIn('is offline', self.sent[-1])
+        self.assertEqual(self.counter('transfers_total', kind='transfer'), 1)
+        # the leave went out with the transfer, nothing is left to send later
+        self.assertEqual(self.outboxRows(), 0)
+        self.advance(self.notifier.transferWindowS)
+        self.assertEqual(self.drain(), 0)
+
+    def test_reconnect_is_dropped(self):
+        self.poll(0, {ALICE: 'Alice', BOB: 'Bob'})
+        self.drain()
+        self.advance(60)
+        self.poll(0, {BOB: 'Bob'})
+        self.assertEqual(self.drain(), 0)
+        self.advance(30)
+        self.poll(0, {ALICE: 'Alice', BOB: 'Bob'})
+        self.assertEqual(self.drain(), 0)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(self.counter('transfers_total', kind='reconnect'), 1)
+        self.assertEqual(self.outboxRows(), 0)
+
+    def test_leave_is_held_for_the_transfer_window(self):
+        self.poll(0, {ALICE: 'Alice'})
+        self.drain()
+        self.advance(60)
+        self.poll(0, {})
+        sent, nextDue = self.notifier.drainOutbox(self.cons)
+        self.assertEqual(sent, 0)
+        self.assertEqual(nextDue, self.now + support.datetime.timedelta(seconds=self.notifier.transferWindowS))
+        self.advance(self.notifier.transferWindowS)
+        self.assertEqual(self.drain(), 1)
+        self.assertIn('Alice', self.sent[-1])
+        self.assertEqual(self.outboxRows(), 0)
+
+    def test_late_leave_after_join_elsewhere(self):
+        # the other server noticed the join and sent it before this one noticed the leave
+        self.poll(0, {ALICE: 'Alice'})
+        self.drain()
+        self.advance(60)
+        self.poll(1, {ALICE: 'Alice'})
+        self.drain()
+        self.advance(30)
+        self.poll(0, {})
+        self.advance(self.notifier.transferWindowS)
+        self.assertEqual(self.drain(), 0)
+        self.assertEqual(self.counter('transfers_total', kind='late'), 1)
+        self.assertEqual(self.outboxRows(), 0)
+
+
+class GroupTelegramMsgsTest(support.NotifierTestCase):
+    serverCount = 0
+
+    def test_merged_up_to_the_limit(self):
+        self.notifier.telegramMaxMsgLength = 10
+        parts = self.notifier.groupTelegramMsgs([('abc\n', [1]), ('def', [2]), ('ghijk', [3]), ('x' * 15, [4])])
+        self.assertEqual(parts, [('abc\n\ndef', [1, 2]), ('ghijk', [3]), ('x' * 10, [4])])
+
+    def test_single_message(self):
+        self.assertEqual(self.notifier.groupTelegramMsgs([('hello', [1])]), [('hello', [1])])
+        self.assertEqual(self.notifier.groupTelegramMsgs([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+import rcontrace
+
+T0 = datetime.datetime(2026, 10, 17, 20, 0)
+
+
+def at(seconds):
+    return T0 + datetime.timedelta(seconds=seconds)
+
+
+class TraceTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def lines(self, name):
+        with open(self.path(name)) as f:
+            return f.read().splitlines()
+
+    def test_record_and_read(self):
+        recorder = rcontrace.Recorder(self.dir)
+        recorder.record('ark-01.trace', at(0), True, 'A')
+        recorder.record('ark-01.trace', at(60), True, 'A')
+        recorder.record('ark-01.trace', at(120), False)
+        recorder.record('ark-01.trace', at(180), True, 'A')
+        recorder.record('ark-01.trace', at(240), True, 'B')
+        self.assertEqual(len([line for line in self.lines('ark-01.trace') if '"reply"' in line]), 2)
+        self.assertEqual(list(rcontrace.readtrace(self.path('ark-01.trace'))),
+                         [(at(0), True, 'A'), (at(60), True, 'A'), (at(120), False, None),
+                          (at(180), True, 'A'), (at(240), True, 'B')])
+
+    def test_dedupe_across_runs(self):
+        # every cron run has a recorder of its own
+        for i in range(3):
+            rcontrace.Recorder(self.dir).record('ark-01.trace', at(i * 60), True, 'A')
+        rcontrace.Recorder(self.dir).record('ark-01.trace', at(180), True, 'B')
+        self.assertEqual([line.count('"reply"') for line in self.lines('ark-01.trace')], [1, 0, 0, 1])
+        self.assertEqual([reply for t, online, reply in rcontrace.readtrace(self.path('ark-01.trace'))],
+                         ['A', 'A', 'A', 'B'])
+
+    def test_lastreply_over_several_blocks(self):
+        recorder = rcontrace.Recorder(self.dir)
+        recorder.record('ark-01.trace', at(0), True, 'x' * 300)
+        for i in range(1, 50):
+            recorder.record('ark-01.trace', at(i), False)
+        self.assertEqual(rcontrace.lastreply(self.path('ark-01.trace'), blocksize=64), 'x' * 300)
+        self.assertIsNone(rcontrace.lastreply(self.path('missing.trace')))
+
+    def test_invalid_entry(self):
+        with open(self.path('bad.trace'), 'w') as f:
+            f.write('{"t":"2026-10-17T20:00:00","up":1,"reply":"A"}\n{"up":1}\n')
+        with self.assertRaises(ValueError) as context:
+            list(rcontrace.readtrace(self.path('bad.trace')))
+        self.assertIn('bad.trace:2', str(context.exception))
+
+    def test_mergetraces_in_time_order(self):
+        recorder = rcontrace.Recorder(self.dir)
+        for seconds in (0, 60, 120):
+            recorder.record('ark-01.trace', at(seconds), True, 'A')
+        for seconds in (30, 60, 90):
+            recorder.record('ark-02.trace', at(seconds), seconds != 60, 'B')
+        merged = list(rcontrace.mergetraces({'1': self.path('ark-01.trace'), '2': self.path('ark-02.trace')}))
+        self.assertEqual(merged, [(at(0), '1', True, 'A'), (at(30), '2', True, 'B'), (at(60), '1', True, 'A'),
+                                  (at(60), '2', False, None), (at(90), '2', True, 'B'), (at(120), '1', True, 'A')])
+
+
+if __name__ == '__main__':
+    unittest.main()
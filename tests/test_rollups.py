@@ -0,0 +1,72 @@
+import datetime
+import unittest
+
+import support
+
+ALICE = 76561190000000001
+BOB = 76561190000000002
+
+
+class SplitTest(support.NotifierTestCase):
+    serverCount = 0
+
+    def test_splitByHour(self):
+        start = datetime.datetime(2026, 10, 17, 20, 45)
+        self.assertEqual(list(self.notifier.splitByHour(start, datetime.datetime(2026, 10, 17, 22, 10))),
+                         [(datetime.datetime(2026, 10, 17, 20), 900.0), (datetime.datetime(2026, 10, 17, 21), 3600.0),
+                          (datetime.datetime(2026, 10, 17, 22), 600.0)])
+        self.assertEqual(list(self.notifier.splitByHour(start, start)), [])
+
+    def test_splitByDay(self):
+        start = datetime.datetime(2026, 10, 17, 23, 30)
+        self.assertEqual(list(self.notifier.splitByDay(start, datetime.datetime(2026, 10, 19, 1, 0))),
+                         [(datetime.date(2026, 10, 17), 1800.0), (datetime.date(2026, 10, 18), 86400.0),
+                          (datetime.date(2026, 10, 19), 3600.0)])
+
+
+class RollupTest(support.NotifierTestCase):
+    serverCount = 1
+
+    def hourly(self, hour):
+        server, con = self.cons[0]
+        return con.execute(f"SELECT * FROM \"{self.notifier.hourlyRollupTable}\" WHERE hour = ?;", (hour,)).fetchone()
+
+    def test_hourly_average_is_time_weighted(self):
+        self.now = datetime.datetime(2026, 10, 17, 20, 0)
+        self.poll(0, {ALICE: 'Alice', BOB: 'Bob'})
+        # two players for 45 minutes, one for the last 15: 1.75 on average
+        self.advance(45 * 60)
+        self.poll(0, {ALICE: 'Alice'})
+        self.advance(15 * 60)
+        self.poll(0, {ALICE: 'Alice'})
+        row = self.hourly(datetime.datetime(2026, 10, 17, 20))
+        self.assertEqual(row['observed_seconds'], 3600)
+        self.assertEqual(row['player_seconds'] / row['observed_seconds'], 1.75)
+        self.assertEqual(row['peak_players'], 2)
+        self.assertEqual(self.hourly(datetime.datetime(2026, 10, 17, 21))['observed_seconds'], 0)
+
+    def test_gap_is_left_out(self):
+        self.poll(0, {ALICE: 'Alice'})
+        self.advance(self.notifier.rollupMaxGapS + 60)
+        self.poll(0, {ALICE: 'Alice'})
+        self.assertEqual(self.hourly(datetime.datetime(2026, 10, 17, 20))['observed_seconds'], 0)
+
+    def test_player_days_across_midnight(self):
+        self.now = datetime.datetime(2026, 10, 17, 23, 30)
+        self.poll(0, {ALICE: 'Alice'})
+        self.advance(60 * 60)
+        self.poll(0, {})
+        server, con = self.cons[0]
+        rows = con.execute(f"SELECT day, seconds FROM \"{self.notifier.playerDayRollupTable}\" "
+                           f"WHERE steamId = ? ORDER BY day;", (ALICE,)).fetchall()
+        self.assertEqual([tuple(row) for row in rows],
+                         [(datetime.date(2026, 10, 17), 1800.0), (datetime.date(2026, 10, 18), 1800.0)])
+        days = con.execute(f"SELECT day, unique_players FROM \"{self.notifier.dailyRollupTable}\" ORDER BY day;").fetchall()
+        self.assertEqual([tuple(row) for row in days], [(datetime.date(2026, 10, 17), 1), (datetime.date(2026, 10, 18), 1)])
+        self.assertEqual(self.notifier.getPlayerPlaytime(con, ALICE, datetime.datetime(2026, 10, 17),
+                                                         datetime.datetime(2026, 10, 19)),
+                         {datetime.date(2026, 10, 17): 1800.0, datetime.date(2026, 10, 18): 1800.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+import support
+
+
+class NextPollDelayTest(support.NotifierTestCase):
+    serverCount = 0
+
+    def setUp(self):
+        support.NotifierTestCase.setUp(self)
+        self.notifier.pollJitter = 0
+
+    def session(self, online=True, changed=False, roster=None, failures=0):
+        return {'online': online, 'changed': changed, 'roster': roster, 'failures': failures}
+
+    def test_backoff(self):
+        session = self.session(online=False)
+        delays = [self.notifier.nextPollDelay(session, 60) for i in range(7)]
+        self.assertEqual(delays, [60, 120, 240, 480, 960, 1800, 1800])
+        self.assertEqual(session['failures'], 7)
+
+    def test_backoff_after_weeks_offline(self):
+        session = self.session(online=False, failures=1100)
+        self.assertEqual(self.notifier.nextPollDelay(session, 60), self.notifier.pollBackoffMaxS)
+        self.assertEqual(session['failures'], 1101)
+
+    def test_online_resets_failures(self):
+        session = self.session(roster={1: {}}, failures=5)
+        self.assertEqual(self.notifier.nextPollDelay(session, 60), 60)
+        self.assertEqual(session['failures'], 0)
+
+    def test_fast_after_a_change(self):
+        self.assertEqual(self.notifier.nextPollDelay(self.session(changed=True, roster={1: {}}), 60),
+                         self.notifier.pollIntervalFastS)
+        self.assertEqual(self.notifier.nextPollDelay(self.session(changed=True), 10), 10)
+
+    def test_busy_and_idle(self):
+        self.assertEqual(self.notifier.nextPollDelay(self.session(roster={1: {}}), 60), 60)
+        self.assertEqual(self.notifier.nextPollDelay(self.session(roster={}), 60), self.notifier.pollIntervalIdleS)
+        self.assertEqual(self.notifier.nextPollDelay(self.session(roster={}), 600), 600)
+
+    def test_jitter(self):
+        self.notifier.pollJitter = 0.1
+        for i in range(20):
+            self.assertTrue(54 <= self.notifier.nextPollDelay(self.session(roster={1: {}}), 60) <= 66)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import asyncio
+import unittest
+
+import support
+import fakeservers
+import srcds
+
+
+class SentinelFramingTest(unittest.TestCase):
+    # replies split into packets of 64 bytes, so every reply spans several packets
+    def setUp(self):
+        self.fake = fakeservers.FakeRconServer(players=20, split=64, backlog=5)
+        self.port = self.fake.start()
+        self.expected = ''.join(f"{i}. {name}, {steamId}\n" for i, (steamId, name) in enumerate(self.fake.online.items()))
+
+    def tearDown(self):
+        self.fake.shutdown()
+        self.fake.server_close()
+
+    def client(self, sentinel=True):
+        return srcds.SourceRcon('127.0.0.1', self.port, self.fake.password, timeout=2.0, sentinel=sentinel)
+
+    def test_rcon_joins_split_reply(self):
+        client = self.client()
+        try:
+            self.assertGreater(len(self.expected), 64 * 3)
+            self.assertEqual(client.rcon('listplayers').decode(), self.expected)
+            # the connection stays usable for the next command
+            self.assertEqual(client.rcon('listplayers').decode(), self.expected)
+        finally:
+            client.disconnect()
+
+    def test_rconbatch_keeps_replies_apart(self):
+        client = self.client()
+        try:
+            replies = client.rconbatch(['listplayers', 'saveworld', 'listplayers'])
+            self.assertEqual(len(replies), 3)
+            self.assertEqual(replies[0].decode(), self.expected)
+            self.assertEqual(replies[1].decode(), "Server received, But no response!! \n")
+            self.assertEqual(replies[2].decode(), self.expected)
+        finally:
+            client.disconnect()
+
+    def test_rconstream_yields_packets_per_command(self):
+        client = self.client()
+        try:
+            packets = list(client.rconstream(['listplayers', 'getchat']))
+            self.assertGreater(len(packets), 2)
+            self.assertTrue(all(len(data) <= 64 for _, data in packets))
+            indexes = [index for index, _ in packets]
+            self.assertEqual(indexes, sorted(indexes))
+            self.assertEqual(b''.join(data for index, data in packets if index == 0).decode(), self.expected)
+            chat = b''.join(data for index, data in packets if index == 1).decode()
+            self.assertEqual(len(chat.splitlines()), 5)
+        finally:
+            client.disconnect()
+
+    def test_packets_of_the_largest_size(self):
+        fake = fakeservers.FakeRconServer(players=1, backlog=200)
+        client = srcds.SourceRcon('127.0.0.1', fake.start(), fake.password, timeout=2.0, sentinel=True)
+        try:
+            packets = list(client.rconstream(['getchat']))
+            self.assertEqual(max(len(data) for _, data in packets), fakeservers.MAX_BODY)
+            self.assertEqual(len(b''.join(data for _, data in packets).splitlines()), 200)
+        finally:
+            client.disconnect()
+            fake.shutdown()
+            fake.server_close()
+
+    def test_bad_password(self):
+        self.fake.failure = 'badpass'
+        client = self.client()
+        try:
+            self.assertRaises(srcds.SourceRconError, client.rcon, 'listplayers')
+        finally:
+            client.disconnect()
+
+
+class AsyncRconTest(unittest.TestCase):
+    def setUp(self):
+        self.fakes = [fakeservers.FakeRconServer(players=20, split=64, seed=i + 1) for i in range(3)]
+        self.ports = [fake.start() for fake in self.fakes]
+
+    def tearDown(self):
+        for fake in self.fakes:
+            fake.shutdown()
+            fake.server_close()
+
+    def expected(self, fake):
+        return ''.join(f"{i}. {name}, {steamId}\n" for i, (steamId, name) in enumerate(fake.online.items()))
+
+    def run_clients(self, sentinel, commands):
+        async def poll(port):
+            client = srcds.AsyncSourceRcon('127.0.0.1', port, 'benchpass', timeout=2.0, sentinel=sentinel)
+            try:
+                return [await client.rcon(command) for command in commands]
+            finally:
+                await client.disconnect()
+
+        async def pollAll():
+            return await asyncio.gather(*[poll(port) for port in self.ports])
+        return asyncio.run(pollAll())
+
+    def test_sessions_on_one_loop(self):
+        for sentinel in (True, False):
+            replies = self.run_clients(sentinel, ['listplayers', 'saveworld'])
+            for fake, (players, other) in zip(self.fakes, replies):
+                self.assertEqual(players.decode(), self.expected(fake))
+                self.assertEqual(other.decode(), "Server received, But no response!! \n")
+
+    def test_rconbatch(self):
+        async def batch():
+            client = srcds.AsyncSourceRcon('127.0.0.1', self.ports[0], 'benchpass', timeout=2.0, sentinel=True)
+            try:
+                return await client.rconbatch(['listplayers', 'saveworld', 'listplayers'])
+            finally:
+                await client.disconnect()
+        replies = asyncio.run(batch())
+        self.assertEqual([reply.decode() for reply in replies],
+                         [self.expected(self.fakes[0]), "Server received, But no response!! \n", self.expected(self.fakes[0])])
+
+    def test_bad_password(self):
+        self.fakes[0].failure = 'badpass'
+        self.assertRaises(srcds.SourceRconError, self.run_clients, True, ['listplayers'])
+
+
+if __name__ == '__main__':
+    unittest.main()
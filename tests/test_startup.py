@@ -0,0 +1,116 @@
+import datetime
+import os
+import sqlite3
+import stat
+import unittest
+
+import support
+
+CONFIG = """[server:1]
+name: Ark01
+rconIP: 127.0.0.1
+rconPort: 27020
+rconPass: secret
+queryPort: 27015
+chatAlertKeywords: Admin, cheat
+telegramBotToken: abc
+telegramBotChatID: 123
+"""
+
+
+class ConfigCacheTest(support.NotifierTestCase):
+    serverCount = 0
+
+    def setUp(self):
+        support.NotifierTestCase.setUp(self)
+        self.cwd = os.getcwd()
+        os.chdir(self.dbDir)
+        self.writeConfig(CONFIG)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        support.NotifierTestCase.tearDown(self)
+
+    def writeConfig(self, text):
+        with open('config.ini', 'w') as f:
+            f.write(text)
+
+    def parseFails(self):
+        self.fail('config.ini parsed although the cache is up to date')
+
+    def test_parsed_once(self):
+        servers = self.notifier.readConfig()
+        self.assertEqual(servers[0]['name'], 'Ark01')
+        self.assertEqual(servers[0]['rconport'], 27020)
+        self.assertEqual(servers[0]['queryport'], 27015)
+        self.assertEqual(servers[0]['chatalertkeywords'], ['admin', 'cheat'])
+        self.assertEqual(stat.S_IMODE(os.stat(self.notifier.configCacheFile).st_mode), 0o600)
+        self.notifier.parseConfig = self.parseFails
+        self.assertEqual(self.notifier.readConfig(), servers)
+
+    def test_rebuilt_when_config_changes(self):
+        self.notifier.readConfig()
+        self.writeConfig(CONFIG.replace('Ark01', 'Ark01 - The Island'))
+        self.assertEqual(self.notifier.readConfig()[0]['name'], 'Ark01 - The Island')
+
+    def test_rebuilt_for_another_cache_version(self):
+        self.notifier.readConfig()
+        self.notifier.configCacheVersion += 1
+        parsed = []
+        parseConfig = self.notifier.parseConfig
+        self.notifier.parseConfig = lambda: parsed.append(1) or parseConfig()
+        self.notifier.readConfig()
+        self.assertEqual(parsed, [1])
+
+    def test_unreadable_cache(self):
+        self.notifier.readConfig()
+        with open(self.notifier.configCacheFile, 'wb') as f:
+            f.write(b'\x00garbage')
+        self.assertEqual(self.notifier.readConfig()[0]['name'], 'Ark01')
+
+
+class MigrateSchemaTest(support.NotifierTestCase):
+    serverCount = 0
+
+    def test_upgrade_from_version_0(self):
+        # the tables as the first release created them, without a schema version
+        path = os.path.join(self.dbDir, 'ark-01.db')
+        old = sqlite3.connect(path)
+        old.execute(f"""CREATE TABLE '{self.notifier.playerTable}' (steamId INTEGER PRIMARY KEY, name TEXT,
+                        last_logon TIMESTAMP, last_logoff TIMESTAMP, online_now BOOLEAN);""")
+        old.execute(f"""CREATE TABLE '{self.notifier.statusTable}' (serverId INTEGER PRIMARY KEY, checked_on TIMESTAMP,
+                        last_online TIMESTAMP, last_offline TIMESTAMP, last_notified TIMESTAMP, server_online BOOLEAN);""")
+        old.execute(f"INSERT INTO \"{self.notifier.statusTable}\" (serverId, server_online) VALUES (1, 1);")
+        old.execute(f"INSERT INTO \"{self.notifier.playerTable}\" VALUES (7, 'Alice', ?, NULL, 1);",
+                    (datetime.datetime(2026, 10, 17, 19, 0),))
+        old.commit()
+        old.close()
+
+        server = self.serverConfig(1)
+        con = self.notifier.connectDB(path)
+        self.cons.append((server, con))
+        self.notifier.createTable(con, server['id'])
+        self.assertEqual(con.execute("PRAGMA user_version;").fetchone()[0], self.notifier.schemaVersion)
+        self.assertEqual(con.execute("PRAGMA journal_mode;").fetchone()[0], 'wal')
+        statusColumns = [row['name'] for row in con.execute(f"PRAGMA table_info(\"{self.notifier.statusTable}\");")]
+        for column in ('last_synced', 'last_sampled', 'last_player_count'):
+            self.assertIn(column, statusColumns)
+        hourlyColumns = [row['name'] for row in con.execute(f"PRAGMA table_info(\"{self.notifier.hourlyRollupTable}\");")]
+        self.assertIn('player_seconds', hourlyColumns)
+        for table in (self.notifier.sessionTable, self.notifier.outboxTable, self.notifier.chatTable,
+                      self.notifier.outageTable):
+            self.assertEqual(con.execute(f"SELECT COUNT(*) FROM \"{table}\";").fetchone()[0], 0)
+
+        # the player that was online before the upgrade leaves, the session is recorded whole
+        self.assertEqual(self.notifier.loadOnlineRoster(con)[7]['name'], 'Alice')
+        self.poll(0, {})
+        sessions = self.notifier.getSessions(con, datetime.datetime(2026, 10, 17), datetime.datetime(2026, 10, 18))
+        self.assertEqual(sessions, [(7, datetime.datetime(2026, 10, 17, 19, 0), self.now)])
+
+        # an up to date database is left alone
+        self.notifier.createTable(con, server['id'])
+        self.assertEqual(con.execute("PRAGMA user_version;").fetchone()[0], self.notifier.schemaVersion)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import datetime
+import http.client
+import json
+import unittest
+
+import support
+
+
+class StatusApiTest(support.NotifierTestCase):
+    serverCount = 0
+
+    def setUp(self):
+        support.NotifierTestCase.setUp(self)
+        self.httpServer = self.notifier.startStatusServer('127.0.0.1', 0)
+        self.publish('Alice')
+
+    def tearDown(self):
+        self.httpServer.shutdown()
+        self.httpServer.server_close()
+        support.NotifierTestCase.tearDown(self)
+
+    def publish(self, *names):
+        roster = dict((i, {'name': name, 'lastLogon': datetime.datetime(2026, 10, 17, 19, i)})
+                      for i, name in enumerate(names))
+        sessions = [{'server': self.serverConfig(1), 'roster': roster, 'online': True, 'checked': self.now},
+                    {'server': self.serverConfig(2), 'roster': None, 'online': False, 'checked': None}]
+        self.notifier.publishStatus([self.notifier.serverStatus(session) for session in sessions])
+
+    def get(self, path, etag=None):
+        con = http.client.HTTPConnection('127.0.0.1', self.httpServer.server_address[1], timeout=5)
+        try:
+            con.request('GET', path, headers={} if etag is None else {'If-None-Match': etag})
+            response = con.getresponse()
+            return response.status, response.getheader('ETag'), response.read()
+        finally:
+            con.close()
+
+    def test_servers(self):
+        status, etag, body = self.get('/servers')
+        self.assertEqual(status, 200)
+        doc = json.loads(body)
+        self.assertEqual([server['name'] for server in doc['servers']], ['Ark01', 'Ark02'])
+        self.assertEqual(doc['servers'][0]['players'], [{'steamId': 0, 'name': 'Alice', 'since': '2026-10-17T19:00:00'}])
+        status, etag, body = self.get('/servers/2/')
+        self.assertEqual((status, json.loads(body)['player_count']), (200, 0))
+        self.assertEqual(self.get('/servers/3')[0], 404)
+
+    def test_not_modified(self):
+        status, etag, body = self.get('/servers/1')
+        self.assertIsNotNone(etag)
+        self.assertEqual(self.get('/servers/1', etag), (304, etag, b''))
+        self.assertEqual(self.get('/servers/1', f'"other", {etag}')[0], 304)
+        self.assertEqual(self.get('/servers/1', '*')[0], 304)
+        self.assertEqual(self.get('/servers/1', '"other"')[0], 200)
+
+    def test_new_etag_after_a_change(self):
+        status, etag, body = self.get('/servers/1')
+        # an unchanged server keeps its ETag over cycles
+        self.publish('Alice')
+        self.assertEqual(self.get('/servers/1', etag)[0], 304)
+        self.publish('Alice', 'Bob')
+        status, newEtag, body = self.get('/servers/1', etag)
+        self.assertEqual(status, 200)
+        self.assertNotEqual(newEtag, etag)
+        self.assertEqual(json.loads(body)['player_count'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()